@@ -27,6 +27,15 @@ from test.test_package import *
 from test.test_class import *
 from test.test_classextension import *
 from test.test_namespace import *
+from test.test_pool import *
+from test.test_cache import *
+from test.test_renderstore import *
+from test.test_catalog import *
+from test.test_node_util import *
+from test.test_searchindex import *
+from test.test_prefetch import *
+from test.test_workers import *
+from test.test_queries import *
 
 import unittest
 import os
@@ -36,6 +36,9 @@ THE SOFTWARE.
     """,
     zip_safe=True,
     packages=['strac'],
-    entry_points = {'trac.plugins': ['store = strac.repos']},
+    entry_points = {'trac.plugins': ['store = strac.repos',
+                                     'store.admin = strac.admin',
+                                     'store.search = strac.search',
+                                     'store.macros = strac.macros']},
     install_requires=[]
 )
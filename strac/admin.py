@@ -0,0 +1,167 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+#
+# trac-admin commands for maintaining Strac's caches.  These require the
+# IAdminCommandProvider interface introduced in Trac 0.12; on Trac 0.11 the
+# module still loads, but provides no commands.
+
+import time
+
+from trac.core import Component, implements
+from trac.util.text import printout
+
+try:
+    from trac.admin.api import IAdminCommandProvider, AdminCommandError
+except ImportError:
+    IAdminCommandProvider = AdminCommandError = None
+
+from repos import StoreConnector
+from bundlenode import BundleNode
+from packagenode import PackageNode
+from workers import WorkerPool
+
+class StoreAdmin(Component):
+    """Provides trac-admin commands for the Store repository."""
+
+    if IAdminCommandProvider != None:
+        implements(IAdminCommandProvider)
+
+    # IAdminCommandProvider methods.
+
+    def get_admin_commands(self):
+        yield ('strac warm', '[workers]',
+               """Render everything under the configured Store roots
+
+               Descends into every bundle and package beneath the
+               root_store_bundles and root_store_packages settings and
+               renders each class, class extension and namespace into the
+               content cache, using the given number of worker threads
+               (default 4).  Only the render store outlives this command, so
+               set [strac] render_store to share the results with Trac.
+               """,
+               None, self._do_warm)
+        yield ('strac sync', '',
+               """Copy new Store publications into Trac's revision cache
+
+               Requires [strac] revision_cache to be enabled.  The first
+               sync copies every publication in the repository; later ones
+               copy only those published since.
+               """,
+               None, self._do_sync)
+        yield ('strac index', '',
+               """Bring the Store search index up to date
+
+               Requires [strac] search_index to be set.  The first run
+               indexes the latest version of every package in the
+               repository; later runs index only the versions published
+               since.
+               """,
+               None, self._do_index)
+
+    def _do_warm(self, workers = '4'):
+        try:
+            workers = int(workers)
+        except ValueError:
+            raise AdminCommandError('Invalid number of workers: %s' % workers)
+        if workers < 1:
+            raise AdminCommandError('At least one worker is required.')
+
+        connector = StoreConnector(self.env)
+        repos = connector.get_repository('store', '', None)
+        try:
+            packages = self._packages_under(repos.get_node('/'))
+            started = time.time()
+            pool = WorkerPool(workers, 'strac-warm')
+            jobs = []
+            for package in packages:
+                for fullname in package.get_manifest().names():
+                    job = pool.submit(self._warm, connector, package.path, package.rev,
+                                      package.id, fullname)
+                    jobs.append((package.get_name(), fullname, job))
+        finally:
+            repos.close()
+
+        failures = []
+        rendered = streamed = 0
+        for package_name, fullname, job in jobs:
+            try:
+                cached = job.result()
+            except Exception, e:
+                self.log.error('Unable to render %s in %s: %s' % (fullname, package_name, e))
+                failures.append((package_name, fullname, e))
+                continue
+            if cached:
+                rendered += 1
+            elif cached == False:
+                streamed += 1
+
+        elapsed = max(time.time() - started, 0.001)
+        printout('Rendered %i entries from %i packages in %.1f seconds (%.1f entries per second).'
+                 % (rendered, len(packages), elapsed, rendered / elapsed))
+        if streamed:
+            printout('%i entries have more than stream_threshold methods and are rendered as they '
+                     'are read, so were not cached.' % streamed)
+        if failures:
+            printout('%i entries could not be rendered:' % len(failures))
+            for package_name, fullname, e in failures:
+                printout('  %s in %s: %s' % (fullname, package_name, e))
+
+    def _do_sync(self):
+        connector = StoreConnector(self.env)
+        if connector.revisions == None:
+            raise AdminCommandError('Set [strac] revision_cache = true to use the revision cache.')
+
+        repos = connector.get_repository('store', '', None)
+        try:
+            copied = connector.revisions.sync(repos, True)
+        finally:
+            repos.close()
+        printout('Copied %i publications into the revision cache.' % copied)
+
+    def _do_index(self):
+        connector = StoreConnector(self.env)
+        if connector.search_index == None:
+            raise AdminCommandError('Set [strac] search_index to use the search index.')
+
+        repos = connector.get_repository('store', '', None)
+        started = time.time()
+        try:
+            indexed = connector.search_index.update(repos, True)
+        finally:
+            repos.close()
+        printout('Indexed %i package versions in %.1f seconds.' % (indexed, time.time() - started))
+
+    def _packages_under(self, root):
+        """Return the PackageNodes found beneath root, descending into every bundle."""
+
+        packages = {}
+        bundles_seen = set()
+        pending = [root]
+        while pending:
+            for entry in pending.pop().get_entries():
+                if isinstance(entry, BundleNode):
+                    if entry.id not in bundles_seen:
+                        bundles_seen.add(entry.id)
+                        pending.append(entry)
+                elif isinstance(entry, PackageNode):
+                    packages[entry.id] = entry
+        return packages.values()
+
+    def _warm(self, connector, path, rev, package_id, fullname):
+        """Render the entry called fullname in a package, on a repository of the worker's own.
+
+        Return whether the rendered content was cached, which it isn't for entries that are
+        streamed, or None if the package has no such entry.
+        """
+
+        repos = connector.get_repository('store', '', None)
+        try:
+            package = PackageNode(path, rev, repos, package_id)
+            node = package.rendered_subnode_named(fullname)
+            if node == None:
+                return None
+            node.get_content()
+            return node.rendered != None
+        finally:
+            repos.close()
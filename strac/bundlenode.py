@@ -17,24 +17,50 @@ class BundleNode(StoreNode):
 
     def get_entries(self):
         """Generator method that produces the PackageNodes and BundleNodes contained in this bundle."""
-        
-        # Start by looking for any sub-bundles.  Don't bother ordering them because
-        # Trac will scrap the order anyway.
-        for row in self.repos.sql("SELECT subbundleref FROM tw_bundles WHERE bundleref = %i" % self.id):
-            yield BundleNode.with_id(self.repos, row[0])
 
-        # Look for sub-packages next.
-        for row in self.repos.sql("SELECT packageref FROM tw_packages WHERE bundleref = %i" % self.id):
-            yield PackageNode.with_id(self.repos, row[0])
+        # Don't bother ordering the entries because Trac will scrap the order anyway.
+        for kind, primarykey, name, version in self.get_tree().get(self.id, []):
+            if kind == 'B':
+                yield BundleNode('/' + name, version, self.repos, primarykey)
+            else:
+                yield PackageNode('/' + name, version, self.repos, primarykey)
 
         # Store looks in a table called tw_files next.  As my test database has no entries in that
         # table, I do not handle this case.
 
+    def get_tree(self):
+        """Return the contents of this bundle and of every bundle within it, however deeply nested.
+
+        The tree is a dictionary that maps the primary key of each bundle to a list of
+        (kind, primarykey, name, version) tuples, one for each of its entries, where kind is 'B'
+        for a bundle or 'P' for a package.  The whole tree is loaded with a single query, and
+        kept in the repository's bundle tree cache: published bundle versions never change.
+        """
+
+        trees = self.repos.caches.bundle_trees
+        tree = trees.get(self.id)
+        if tree != None:
+            return tree
+
+        tree = {self.id: []}
+        for row in self.repos.query('bundle_tree', (self.id,)):
+            parent, kind, primarykey, name, version = row[0], row[1], row[2], row[3], row[4]
+            tree.setdefault(parent, []).append((kind, primarykey, name, version))
+
+        # Every bundle in the tree can find its own entries within it, too.
+        for entries in tree.values():
+            for kind, primarykey, name, version in entries:
+                if kind == 'B':
+                    tree.setdefault(primarykey, [])
+        for bundle_id in tree.keys():
+            trees.put(bundle_id, tree)
+        return tree
+
     @classmethod
     def with_id(cls, repos, id):
         "Fetch a BundleNode directly by its primary key."
 
-        for row in repos.sql("SELECT primarykey, name, version FROM tw_bundle WHERE primarykey = %i" % id):
+        for row in repos.query('bundle_by_id', (id,)):
             primarykey, name, version = row[0], row[1], row[2]
             return cls('/' + name, version, repos, primarykey)
 
@@ -42,19 +68,22 @@ class BundleNode(StoreNode):
     def with_name(cls, repos, name, rev = None):
         """Return a Node for the bundle with the given name, or None if none are found.
 
-        If rev is not specified, the most recently published bundle version is returned."""
-        if rev != None:
-            version_str = " AND version = '%s'" % rev
-        else:
-            version_str = " ORDER BY timestamp DESC"
+        If rev is not specified, the most recently published bundle version is returned, as found in
+        the repository's map of latest versions."""
+        if rev == None:
+            latest = repos.caches.latest_bundles.lookup(repos, name)
+            if latest == None:
+                return None
+            primarykey, rev = latest
+            return cls('/' + name, rev, repos, primarykey)
 
-        for row in repos.sql(("SELECT primarykey, name, version FROM tw_bundle WHERE name = '%s'" + version_str) % name):
+        for row in repos.query('bundle_by_name', (name, rev)):
             primarykey, name, rev = row[0], row[1], row[2]
             return cls('/' + name, rev, repos, primarykey)
 
     @classmethod
     def all(cls, repos):
         "Generate a collection of Nodes for the latest revisions of all known bundles."
-        for row in repos.sql("SELECT DISTINCT ON(name) primarykey, name, version FROM tw_bundle ORDER BY name, timestamp DESC"):
+        for row in repos.query('latest_bundles', server_side = True):
             primarykey, name, version = row[0], row[1], row[2]
             yield cls('/' + name, version, repos, primarykey)
@@ -0,0 +1,205 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+Process-wide caches of Store data.
+
+Published package and bundle versions never change, so anything that is keyed
+by a primary key can be kept for as long as there is room for it.
+"""
+
+from catalog import LatestVersions, NameCatalog, VersionIndex
+
+import threading
+
+class LRUCache:
+    """A thread-safe mapping that holds at most 'capacity' entries.
+
+    If max_bytes is given, the cache also holds at most max_bytes worth of values,
+    as measured by the sizeof function.  When the cache is full, storing a new entry
+    evicts the ones that were used least recently.  The cache counts its hits and
+    misses.
+    """
+
+    def __init__(self, capacity = None, max_bytes = None, sizeof = len):
+        self.capacity = capacity
+        if capacity != None:
+            self.capacity = max(capacity, 1)
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        # A circular, doubly-linked list of [previous, next, key, value] links,
+        # most recently used first, that starts and ends with a sentinel.
+        self._head = []
+        self._head[:] = [self._head, self._head, None, None]
+
+    def get(self, key, default = None):
+        """Return the value stored under key, or default if there isn't one."""
+
+        self._lock.acquire()
+        try:
+            link = self._entries.get(key)
+            if link == None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(link)
+            self._push(link)
+            return link[3]
+        finally:
+            self._lock.release()
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries if necessary."""
+
+        self._lock.acquire()
+        try:
+            link = self._entries.get(key)
+            if link != None:
+                self._unlink(link)
+                self._forget(link[3])
+                link[3] = value
+            else:
+                link = [None, None, key, value]
+                self._entries[key] = link
+            self._push(link)
+            if self.max_bytes != None:
+                self.bytes += self.sizeof(value)
+
+            while self._is_full():
+                oldest = self._head[0]
+                self._unlink(oldest)
+                self._forget(oldest[3])
+                del self._entries[oldest[2]]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._head[:] = [self._head, self._head, None, None]
+            self.bytes = 0
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _is_full(self):
+        """Answer whether the cache holds more than it should, as long as it holds anything."""
+
+        if len(self._entries) <= 1:
+            return False
+        if self.capacity != None and len(self._entries) > self.capacity:
+            return True
+        return self.max_bytes != None and self.bytes > self.max_bytes
+
+    def _forget(self, value):
+        if self.max_bytes != None:
+            self.bytes -= self.sizeof(value)
+
+    def _push(self, link):
+        """Make link the most recently used entry."""
+
+        first = self._head[1]
+        link[0], link[1] = self._head, first
+        first[0] = self._head[1] = link
+
+    def _unlink(self, link):
+        previous, next = link[0], link[1]
+        previous[1], next[0] = next, previous
+
+class StoreCaches:
+    """The caches that are shared by every StoreRepository in a Trac process.
+
+    bundle_trees maps a bundle's primary key to the contents of every bundle
+    within it, as loaded by BundleNode.  manifests maps a package's primary key
+    to its PackageManifest.  content maps the primary key of a package and the
+    name of a class, class extension or namespace within it to a tuple of the
+    node's kind and its rendered content.  If render_store is set, it is a
+    RenderStore that backs the content cache on disk.  latest_bundles and
+    latest_packages are LatestVersions maps that check for new publications
+    every refresh_interval seconds, and names is the NameCatalog built on them.
+    blobs maps the primary key of a tw_blob row to its decoded contents, up to
+    blob_bytes bytes in all.  fragments holds up to fragment_bytes of rendered
+    content that is reused across package versions: ('method', source id) keys
+    map to the rendered form of one method, and ('page', kind, signature) keys
+    to the whole rendered content of a node, as described by StoreNode.
+    version_indexes holds the VersionIndex of up to version_index_size bundles
+    and packages, keyed by the kind and name in the NameCatalog.  histories
+    maps the name of a package and the full name of a class, class extension or
+    namespace to what it contained in each version of the package, as loaded by
+    StoreRepository.get_path_history(), for up to history_size entries.
+    annotations maps the same keys as content to the changeset rev that
+    introduced each line of the content, as worked out by
+    StoreNode.get_annotations(), for up to history_size nodes.
+    """
+
+    def __init__(self, bundle_tree_size = 256, manifest_size = 1024, content_size = 1000,
+                 render_store = None, refresh_interval = 30, blob_bytes = 32 * 1024 * 1024,
+                 fragment_bytes = 16 * 1024 * 1024, version_index_size = 1024,
+                 history_size = 256):
+        self.bundle_trees = LRUCache(bundle_tree_size)
+        self.manifests = LRUCache(manifest_size)
+        self.content = LRUCache(content_size)
+        self.render_store = render_store
+        self.latest_bundles = LatestVersions('latest_bundles', 'bundles_since', refresh_interval)
+        self.latest_packages = LatestVersions('latest_packages', 'packages_since', refresh_interval)
+        self.names = NameCatalog(self.latest_bundles, self.latest_packages)
+        self.blobs = LRUCache(max_bytes = blob_bytes)
+        self.fragments = LRUCache(max_bytes = fragment_bytes)
+        self.version_indexes = LRUCache(version_index_size)
+        self.histories = LRUCache(history_size)
+        self.annotations = LRUCache(history_size)
+
+    def get_rendered(self, key):
+        """Return the (kind, content) tuple cached under key, or None.
+
+        Entries that are only found in the render store are copied into memory.
+        """
+
+        entry = self.content.get(key)
+        if entry == None and self.render_store != None:
+            entry = self.render_store.get(key)
+            if entry != None:
+                self.content.put(key, entry)
+        return entry
+
+    def put_rendered(self, key, entry):
+        """Cache the (kind, content) tuple entry under key, in memory and in the render store."""
+
+        self.content.put(key, entry)
+        if self.render_store != None:
+            self.render_store.put(key, entry)
+
+    def version_index(self, repos, kind, name):
+        """Return the VersionIndex of the bundle or package called name, loading it if necessary.
+
+        kind is NameCatalog.BUNDLE or NameCatalog.PACKAGE.  A cached index is reloaded, with a
+        single query, once the map of latest versions shows that a newer version has been
+        published since it was loaded.
+        """
+
+        if kind == NameCatalog.BUNDLE:
+            latest, query = self.latest_bundles, 'bundle_versions'
+        else:
+            latest, query = self.latest_packages, 'package_versions'
+
+        key = (kind, name)
+        index = self.version_indexes.get(key)
+        newest = latest.lookup(repos, name)
+        if index == None or (newest != None and not index.has_primarykey(newest[0])):
+            index = VersionIndex(repos.query(query, (name,)))
+            self.version_indexes.put(key, index)
+        return index
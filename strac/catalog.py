@@ -0,0 +1,196 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+In-memory catalogs of the bundles and packages in a Store repository.
+"""
+
+from bisect import bisect_right
+
+import sys
+import threading
+import time
+
+class LatestVersions:
+    """Maps the name of each bundle or package to its most recently published version.
+
+    The map is loaded in full the first time it is needed.  After that, it is refreshed
+    at most once every refresh_interval seconds, by asking only for the versions whose
+    primary keys are greater than any that have been seen so far.  A version published
+    since the last refresh is therefore invisible for up to refresh_interval seconds.
+    """
+
+    def __init__(self, all_query, since_query, refresh_interval = 30):
+        """Create an empty map.
+
+        all_query and since_query name the QUERIES that fetch, respectively, the latest
+        version of every name and every version with a primary key greater than their
+        parameter.  Both produce rows of (primarykey, name, version, timestamp).
+        """
+
+        self.all_query = all_query
+        self.since_query = since_query
+        self.refresh_interval = refresh_interval
+
+        self._latest = {}
+        self._newest_key = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, repos, name):
+        """Return a tuple of the primary key and version most recently published as name, or None."""
+
+        self.refresh(repos)
+        entry = self._latest.get(name)
+        if entry == None:
+            return None
+        return entry[1], entry[2]
+
+    def refresh(self, repos):
+        """Bring the map up to date using repos, unless it was done within the last refresh_interval."""
+
+        if time.time() - self._checked < self.refresh_interval:
+            return
+
+        self._lock.acquire()
+        try:
+            # Another thread may have refreshed the map while this one waited.
+            if time.time() - self._checked < self.refresh_interval:
+                return
+            if self._newest_key == None:
+                rows = repos.query(self.all_query, server_side = True)
+            else:
+                rows = repos.query(self.since_query, (self._newest_key,))
+            # Read every row before merging any, so that a read that fails partway leaves the
+            # map as it was, rather than with a newest key that skips the rows not yet read.
+            self._merge(list(rows))
+            self._checked = time.time()
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        """Force the next lookup to check for new versions."""
+
+        self._checked = 0
+
+    def _merge(self, rows):
+        newest_key = self._newest_key
+        for row in rows:
+            primarykey, name, version, timestamp = row[0], row[1], row[2], row[3]
+            if newest_key == None or primarykey > newest_key:
+                newest_key = primarykey
+            entry = self._latest.get(name)
+            if entry == None or (timestamp, primarykey) > (entry[0], entry[1]):
+                self._latest[name] = (timestamp, primarykey, version)
+        self._newest_key = newest_key
+
+class NameCatalog:
+    """Classifies names as those of bundles, packages or both.
+
+    The catalog is built on the LatestVersions maps of bundles and packages, so it
+    is loaded and refreshed along with them and classifies names without a query
+    in the common case.
+    """
+
+    BUNDLE = 'B'
+    PACKAGE = 'P'
+
+    def __init__(self, latest_bundles, latest_packages):
+        self.latest_bundles = latest_bundles
+        self.latest_packages = latest_packages
+
+    def kinds_of(self, repos, name):
+        """Return a list of the kinds of entity called name: bundles first, then packages."""
+
+        kinds = []
+        if self.latest_bundles.lookup(repos, name) != None:
+            kinds.append(self.BUNDLE)
+        if self.latest_packages.lookup(repos, name) != None:
+            kinds.append(self.PACKAGE)
+        return kinds
+
+class VersionIndex:
+    """The published versions of one bundle or package, in the order they were published.
+
+    Versions are ordered by publication timestamp, then by primary key.  Stepping from a
+    version to its neighbours costs a dictionary lookup, and finding the version that was
+    current at a given time is a binary search.
+    """
+
+    def __init__(self, rows):
+        """Build an index from (primarykey, version, timestamp) rows, in any order."""
+
+        entries = [(row[2], row[0], row[1]) for row in rows]
+        entries.sort()
+        self._times = [(timestamp, primarykey) for timestamp, primarykey, version in entries]
+        self.versions = [version for timestamp, primarykey, version in entries]
+        self.primarykeys = [primarykey for timestamp, primarykey, version in entries]
+        self._positions = {}
+        for position, version in enumerate(self.versions):
+            self._positions[version] = position
+        self._primarykeys = set(self.primarykeys)
+
+    def __len__(self):
+        return len(self.versions)
+
+    def has_primarykey(self, primarykey):
+        """Answer whether the index includes the version with primary key primarykey."""
+
+        return primarykey in self._primarykeys
+
+    def position(self, version):
+        """Return the place of version in versions, or None if it is unknown."""
+
+        return self._positions.get(version)
+
+    def oldest(self):
+        if self.versions:
+            return self.versions[0]
+        return None
+
+    def youngest(self):
+        if self.versions:
+            return self.versions[-1]
+        return None
+
+    def previous(self, version):
+        """Return the version published before version, or None if it was the first or is unknown."""
+
+        position = self._positions.get(version)
+        if position == None or position == 0:
+            return None
+        return self.versions[position - 1]
+
+    def next(self, version):
+        """Return the version published after version, or None if it is the latest or is unknown."""
+
+        position = self._positions.get(version)
+        if position == None or position + 1 == len(self.versions):
+            return None
+        return self.versions[position + 1]
+
+    def timestamp_of(self, version):
+        """Return the Store timestamp at which version was published, or None if it is unknown."""
+
+        position = self._positions.get(version)
+        if position == None:
+            return None
+        return self._times[position][0]
+
+    def version_at(self, timestamp):
+        """Return the latest version published at or before the Store timestamp, or None."""
+
+        position = bisect_right(self._times, (timestamp, sys.maxint)) - 1
+        if position < 0:
+            return None
+        return self.versions[position]
+
+    def older_than(self, version1, version2):
+        """Answer whether version1 was published before version2.  Unknown versions are never older."""
+
+        position1 = self._positions.get(version1)
+        position2 = self._positions.get(version2)
+        if position1 == None or position2 == None:
+            return False
+        return position1 < position2
@@ -2,11 +2,9 @@
 # This software is licensed as described in the file COPYING in the root
 # directory of this distribution.
 
-from node_util import _strac_decode, Protocol, Method
+from node_util import Protocol, Method
 from storenode import StoreNode
 
-import cStringIO
-
 class ClassExtensionNode(StoreNode):
     """A Class extension that belongs to a package.
 
@@ -16,6 +14,8 @@ class ClassExtensionNode(StoreNode):
     table among the rows that share the owning package's 'packageref'.
     """
 
+    entry_kind = 'E'
+
     def __init__(self, fullname, owning_package):
         self.created_path = path = owning_package.path + '/' + self._normalize_name(fullname)
         self.created_rev = rev = owning_package.rev
@@ -28,27 +28,26 @@ class ClassExtensionNode(StoreNode):
     def get_content(self):
         """Return a stream that contains the class extension's formatted contents."""
 
-        stream = cStringIO.StringIO()
+        return self._cached_content(self._render)
+
+    def _render(self):
+        """Generate the class extension's formatted contents, a section or protocol at a time."""
 
         # First: a header that describes the extension, in place of a ClassNode's
         # class definition.
-        stream.write("Class {{{")
-        stream.write(self.get_class_name())
-        stream.write("}}}, as extended by {{{")
-        stream.write(self.owning_package.get_name())
-        stream.write("}}}.\n\n")
+        yield "Class {{{" + self.get_class_name() + "}}}, as extended by {{{" + \
+            self.owning_package.get_name() + "}}}.\n\n"
 
         # Second: instance-side protocols and contained methods.
-        self._write_protocols(stream, "=== Instance-Side Methods ===", self.instance_protocols)
+        for chunk in self._format_protocols("=== Instance-Side Methods ===", self.instance_protocols):
+            yield chunk
 
         # Third: class-side protocols and contained methods.
-        self._write_protocols(stream, "\n=== Class-Side Methods ===", self.class_protocols)
+        for chunk in self._format_protocols("\n=== Class-Side Methods ===", self.class_protocols):
+            yield chunk
 
         # Fourth: shared variables
-        self._write_shared_vars(stream, "\n=== Class Shared Variables ===", self.shared_vars)
-
-        stream.reset()
-        return stream
+        yield self._format_shared_vars("\n=== Class Shared Variables ===", self.shared_vars)
 
     def get_content_type(self):
         """Force rendering as a Trac wiki page."""
@@ -68,6 +67,19 @@ class ClassExtensionNode(StoreNode):
     def get_shared_variables(self):
         return self.shared_vars
 
+    def _get_methods(self):
+        return [method for protocol in self.instance_protocols + self.class_protocols
+                for method in protocol.get_methods()]
+
+    def _protocol_sections(self):
+        return [self.instance_protocols, self.class_protocols]
+
+    def _signature(self):
+        # The header names the owning package, which doesn't change across its versions.
+        return StoreNode._signature(self) + (self.owning_package.get_name(),
+                                             self._protocols_signature(self.instance_protocols),
+                                             self._protocols_signature(self.class_protocols))
+
     @classmethod
     def just_named(cls, name, owning_package):
         """
@@ -80,7 +92,10 @@ class ClassExtensionNode(StoreNode):
 
     @classmethod
     def fully_initialized(cls, name, owning_package, iprotocols, cprotocols, svars):
-        """Return a ClassExtensionNode that is knows all of its methods and their source code."""
+        """Return a ClassExtensionNode that knows all of its methods.
+
+        The source code of the methods and shared variables remains to be fetched by load_sources().
+        """
 
         inst = cls.just_named(name, owning_package)
         inst.instance_protocols = iprotocols
@@ -2,11 +2,9 @@
 # This software is licensed as described in the file COPYING in the root
 # directory of this distribution.
 
-from node_util import _strac_decode, Protocol, Method, SharedVariable
+from node_util import Protocol, Method, SharedVariable
 from storenode import StoreNode
 
-import cStringIO
-
 class ClassNode(StoreNode):
     """A Class in the Store repository.
 
@@ -15,6 +13,8 @@ class ClassNode(StoreNode):
     manner by the get_contents method.
     """
 
+    entry_kind = 'C'
+
     def __init__(self, fullname, id, owning_package):
         self.created_path = path = owning_package.path + '/' + self._normalize_name(fullname)
         self.created_rev = rev = owning_package.rev
@@ -24,32 +24,33 @@ class ClassNode(StoreNode):
         self.instance_protocols = []
         self.class_protocols = []
         self.shared_vars = []
+        self.definition = None
+        self.comment = None
 
     def get_content(self):
         """Return a stream that contains the Class's formatted contents."""
 
-        stream = cStringIO.StringIO()
+        return self._cached_content(self._render)
+
+    def _render(self):
+        """Generate the Class's formatted contents, a section or protocol at a time."""
 
         # First: the class definition.
-        stream.write("{{{\n")
-        stream.write(self.get_definition().strip())
-        stream.write("\n}}}\n\n")
+        yield "{{{\n" + self.get_definition().strip() + "\n}}}\n\n"
 
         # Second: the class comment.
-        self._write_comment(stream, "=== Class Comment ===", self.get_comment())
+        yield self._format_comment("=== Class Comment ===", self.get_comment())
 
         # Third: instance-side protocols and contained methods.
-        self._write_protocols(stream, "=== Instance-Side Methods ===", self.instance_protocols)
+        for chunk in self._format_protocols("=== Instance-Side Methods ===", self.instance_protocols):
+            yield chunk
 
         # Fourth: class-side protocols and contained methods.
-        self._write_protocols(stream, "\n=== Class-Side Methods ===", self.class_protocols)
+        for chunk in self._format_protocols("\n=== Class-Side Methods ===", self.class_protocols):
+            yield chunk
 
         # Fifth: shared variables
-        self._write_shared_vars(stream, "\n=== Class Shared Variables ===", self.shared_vars)
-
-        stream.reset()
-        
-        return stream
+        yield self._format_shared_vars("\n=== Class Shared Variables ===", self.shared_vars)
 
     def get_definition(self):
         """Get the definition string that creates this Class."""
@@ -59,14 +60,26 @@ class ClassNode(StoreNode):
     def get_comment(self):
         """Get the class comment string for this class, if any."""
 
+        if self.comment != None:
+            return self.comment
         if self.comment_id == 0:
             return ''
-        for row in self.repos.sql("SELECT blobdata FROM tw_blob WHERE primarykey = %i" % self.comment_id):
-            return _strac_decode(row[0])
+        return self.repos.get_blobs([self.comment_id]).get(self.comment_id, '')
 
     def get_shared_variables(self):
         return self.shared_vars
 
+    def _get_methods(self):
+        return [method for protocol in self.instance_protocols + self.class_protocols
+                for method in protocol.get_methods()]
+
+    def _protocol_sections(self):
+        return [self.instance_protocols, self.class_protocols]
+
+    def _signature(self):
+        return StoreNode._signature(self) + (self._protocols_signature(self.instance_protocols),
+                                             self._protocols_signature(self.class_protocols))
+
     def get_content_type(self):
         return 'text/x-trac-wiki'
 
@@ -83,15 +96,16 @@ class ClassNode(StoreNode):
 
     @classmethod
     def fully_initialized(cls, fullname, id, owning_package,
-                          definition, comment_id,
+                          definition_id, comment_id,
                           instance_protocols, class_protocols, shared_vars):
         """Create a ClassNode with exhaustive knowledge of its definition and contents.
 
-        Only the class comment remains to be fetched.
+        The text of the definition, comment, methods and shared variables remains to be
+        fetched by load_sources().
         """
 
         inst = cls(fullname, id, owning_package)
-        inst.definition = definition
+        inst.definition_id = definition_id
         inst.comment_id = comment_id
         inst.instance_protocols = instance_protocols
         inst.class_protocols = class_protocols
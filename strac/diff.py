@@ -0,0 +1,109 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+Method-level differences between two versions of a package.
+"""
+
+from trac.versioncontrol.api import Node, Changeset
+
+from storenode import StoreNode
+from node_util import ContentStream
+
+class PackageDiff:
+    """The classes, class extensions and namespaces that differ between two package versions.
+
+    Every part of an entry -- each method, its definition, its comment and each shared
+    variable -- is identified by the primary key of its blob.  The parts of one version that
+    are not in the other are found by the database, with one EXCEPT query in each direction,
+    so parts that the versions share are never transferred, let alone decoded or rendered.
+    Only the source of the parts that differ is fetched, in a single batch.
+    """
+
+    def __init__(self, repos, old_package, new_package):
+        self.repos = repos
+        self.old_package = old_package
+        self.new_package = new_package
+
+    def get_changes(self, fullname = None):
+        """Return a list of (old_node, new_node, kind, change) tuples, one for each entry that differs.
+
+        The nodes are DiffNodes whose content holds only the parts of their entry that differ.
+        If fullname is given, only the entry with that fully-qualified name is compared.
+        """
+
+        removed = self._parts(self.old_package, self.new_package, fullname)
+        added = self._parts(self.new_package, self.old_package, fullname)
+
+        blob_ids = []
+        for parts in removed.values() + added.values():
+            blob_ids.extend(parts.values())
+        blobs = self.repos.get_blobs(blob_ids)
+
+        old_manifest = self.old_package.get_manifest()
+        new_manifest = self.new_package.get_manifest()
+        entries = set(removed.keys()) | set(added.keys())
+
+        changes = []
+        for entry in sorted(entries):
+            old_node = new_node = None
+            if old_manifest.kind_of(entry) != None:
+                old_node = DiffNode(self.old_package, entry, removed.get(entry, {}), blobs)
+            if new_manifest.kind_of(entry) != None:
+                new_node = DiffNode(self.new_package, entry, added.get(entry, {}), blobs)
+
+            if old_node == None and new_node == None:
+                continue
+            elif old_node == None:
+                change = Changeset.ADD
+            elif new_node == None:
+                change = Changeset.DELETE
+            else:
+                change = Changeset.EDIT
+            changes.append((old_node, new_node, Node.FILE, change))
+        return changes
+
+    def _parts(self, package, other, fullname):
+        """Return a dictionary that maps each entry of package to a dictionary of those of its parts
+        that aren't in other, by label, to their blob ids."""
+
+        entries = {}
+        for row in self.repos.query('package_parts_except', (package.id, other.id), server_side = True):
+            entry, label, blob_id = row[0], row[1], row[2]
+            if fullname == None or entry == fullname:
+                entries.setdefault(entry, {})[label] = blob_id
+        return entries
+
+class DiffNode(StoreNode):
+    """One side of the difference between two versions of a class, class extension or namespace.
+
+    A DiffNode has the path and revision of the entry in its package version, but its content
+    is only the parts of the entry that the other version does not share, in order of their
+    labels.  Trac compares the content of the two sides line by line, so parts that are
+    modified line up with each other.
+    """
+
+    def __init__(self, package, fullname, parts, blobs):
+        self.created_path = path = package.path + '/' + self._normalize_name(fullname)
+        self.created_rev = rev = package.rev
+        StoreNode.__init__(self, path, rev, StoreNode.FILE, package.repos)
+        self.owning_package = package
+        self.fullname = fullname
+
+        content = []
+        for label in sorted(parts.keys()):
+            content.append(self._normalize_name(label))
+            content.append("\n{{{\n")
+            content.append(blobs.get(parts[label], '').strip())
+            content.append("\n}}}\n\n")
+        self.content = ''.join(content)
+
+    def get_content(self):
+        return ContentStream([self.content])
+
+    def get_content_length(self):
+        return len(self.content)
+
+    def get_content_type(self):
+        return 'text/x-trac-wiki'
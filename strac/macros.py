@@ -0,0 +1,86 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+#
+# Wiki macros that list the implementors and senders of a selector, from the
+# cross-reference kept in the search index configured by [strac] search_index.
+
+from genshi.builder import tag
+
+from trac.wiki.macros import WikiMacroBase
+
+from repos import StoreConnector
+
+class _CrossReferenceMacro(WikiMacroBase):
+    """Lists methods from the cross-reference in the Store search index."""
+
+    abstract = True
+
+    def expand_macro(self, formatter, name, content):
+        selector = (content or '').strip()
+        if selector.startswith('#'):
+            selector = selector[1:]
+        if not selector:
+            return tag.p('A selector is required, for example [[%s(printOn:)]].' % name)
+        if 'BROWSER_VIEW' not in formatter.perm:
+            return tag.p('You are not allowed to browse the Store repository.')
+
+        connector = StoreConnector(self.env)
+        index = connector.search_index
+        if index == None or not index.is_built():
+            return tag.p('The Store cross-reference is unavailable: set [strac] search_index '
+                         'and run trac-admin strac index.')
+
+        repos = connector.get_repository('store', '', None)
+        try:
+            index.update(repos)
+        finally:
+            repos.close()
+
+        items = []
+        for row in self._lookup(index, selector):
+            package, version, entry, class_side = row[0], row[1], row[2], row[3]
+            if entry.startswith('Root.Smalltalk.'):
+                entry = entry[len('Root.Smalltalk.'):]
+            label = entry
+            if class_side:
+                label += ' class'
+            label += '>>' + self._method(row, selector)
+            items.append(tag.li(tag.a(label, href = formatter.href.browser('/' + package + '/' + entry,
+                                                                            rev = version)),
+                                ' in %s %s' % (package, version)))
+        if not items:
+            return tag.p('No %s of %s.' % (name.lower(), selector))
+        return tag.ul(items)
+
+    def _lookup(self, index, selector):
+        raise NotImplementedError
+
+    def _method(self, row, selector):
+        raise NotImplementedError
+
+class ImplementorsMacro(_CrossReferenceMacro):
+    """Lists the methods that implement a selector in the latest version of each Store package.
+
+    For example, `[[Implementors(printOn:)]]` links to every class, class extension and
+    namespace that defines printOn:.  Requires `[strac] search_index`.
+    """
+
+    def _lookup(self, index, selector):
+        return index.implementors(selector)
+
+    def _method(self, row, selector):
+        return selector
+
+class SendersMacro(_CrossReferenceMacro):
+    """Lists the methods that send a selector in the latest version of each Store package.
+
+    For example, `[[Senders(at:put:)]]` links to every method that sends at:put:, or mentions
+    the symbol #at:put:.  Requires `[strac] search_index`.
+    """
+
+    def _lookup(self, index, selector):
+        return index.senders(selector)
+
+    def _method(self, row, selector):
+        return row[4]
@@ -3,9 +3,6 @@
 # directory of this distribution.
 
 from storenode import StoreNode
-from node_util import _strac_decode
-
-import cStringIO
 
 class NamespaceNode(StoreNode):
     """A Namespace in the Store repository.
@@ -14,6 +11,8 @@ class NamespaceNode(StoreNode):
     Like classes, they share the revision number of their owning package.
     """
 
+    entry_kind = 'N'
+
     def __init__(self, fullname, id, owning_package):
         self.created_path = path = owning_package.path + '/' + self._normalize_name(fullname)
         self.created_rev = rev = owning_package.rev
@@ -23,26 +22,24 @@ class NamespaceNode(StoreNode):
         self.definition = '<none provided>'
         self.owning_package = owning_package
         self.shared_vars = []
+        self.comment = None
 
     def get_content(self):
         """Return a stream that contains the definition of this namespace."""
 
-        stream = cStringIO.StringIO()
+        return self._cached_content(self._render)
+
+    def _render(self):
+        """Generate the definition of this namespace."""
 
         # First: the definition.
-        stream.write("{{{\n")
-        stream.write(self.get_definition().strip())
-        stream.write("\n}}}\n\n")
+        yield "{{{\n" + self.get_definition().strip() + "\n}}}\n\n"
 
         # Second: the comment.
-        self._write_comment(stream, "=== Namespace Comment ===", self.get_comment())
+        yield self._format_comment("=== Namespace Comment ===", self.get_comment())
 
         # Third: shared variables.
-        self._write_shared_vars(stream, "=== Namespace Shared Variables ===", self.shared_vars)
-
-        stream.reset()
-
-        return stream
+        yield self._format_shared_vars("=== Namespace Shared Variables ===", self.shared_vars)
 
     def get_content_type(self):
         return 'text/x-trac-wiki'
@@ -55,12 +52,11 @@ class NamespaceNode(StoreNode):
     def get_comment(self):
         """Return the comment associated with this namespace, if any."""
 
+        if self.comment != None:
+            return self.comment
         if self.comment_id == 0:
             return ''
-        for row in self.repos.sql("""
-              SELECT blobdata FROM tw_blob WHERE primarykey = %i
-              """ % self.comment_id):
-            return _strac_decode(row[0])
+        return self.repos.get_blobs([self.comment_id]).get(self.comment_id, '')
 
     def get_name(self):
         """Override the default node name generation to look prettier."""
@@ -74,12 +70,12 @@ class NamespaceNode(StoreNode):
         return cls(fullname, None, owning_package)
 
     @classmethod
-    def fully_initialized(cls, fullname, id, owning_package, definition, comment_id, shared_vars):
-        """Create a NamespaceNode with all relevant information, including a prefetched
-        definition."""
+    def fully_initialized(cls, fullname, id, owning_package, definition_id, comment_id, shared_vars):
+        """Create a NamespaceNode with all relevant information.  The text of its definition,
+        comment and shared variables remains to be fetched by load_sources()."""
 
         inst = cls(fullname, id, owning_package)
-        inst.definition = definition
+        inst.definition_id = definition_id
         inst.comment_id = comment_id
         inst.shared_vars = shared_vars
         return inst
@@ -6,12 +6,61 @@
 Utility classes and methods.
 """
 
-from base64 import b64decode
+from binascii import a2b_base64
+from datetime import datetime, timedelta
+from trac.util.datefmt import utc
+
+# Store records the time of each publication in whole seconds since the start of 1901.
+_STORE_EPOCH = datetime(1901, 1, 1, tzinfo = utc)
+_UNIX_EPOCH = datetime(1970, 1, 1, tzinfo = utc)
 
 def _strac_decode(blob):
     """Decode Store textual data from the table tw_blob into a Python string."""
 
-    return b64decode(blob).replace("\r", "\n")
+    return a2b_base64(blob).replace("\r", "\n")
+
+def _strac_decode_rows(rows, decoded_on_server = False):
+    """Decode the (primarykey, blobdata) rows of tw_blob into a dictionary of Python strings.
+
+    Each blob is decoded straight from base64 into a single string, and only copied
+    again to convert its line ends if it contains any.  If decoded_on_server is true,
+    the rows come from the decoded_blobs query, which has the database do all of the
+    decoding, and are collected as they are.
+    """
+
+    blobs = {}
+    if decoded_on_server:
+        for row in rows:
+            blobs[row[0]] = row[1]
+        return blobs
+
+    for row in rows:
+        text = a2b_base64(row[1])
+        if "\r" in text:
+            text = text.replace("\r", "\n")
+        blobs[row[0]] = text
+    return blobs
+
+def _int_array(values):
+    """Format a sequence of integers as a PostgreSQL array literal, for an int4[] query parameter."""
+
+    return '{' + ','.join([str(int(value)) for value in values]) + '}'
+
+def _store_time(seconds):
+    """Convert a Store timestamp into a datetime."""
+
+    return _STORE_EPOCH + timedelta(seconds = seconds)
+
+def _store_seconds(when):
+    """Convert a datetime, or a number of seconds since 1970 as returned by time.time(), into a
+    Store timestamp."""
+
+    if not isinstance(when, datetime):
+        when = _UNIX_EPOCH + timedelta(seconds = when)
+    elif when.tzinfo == None:
+        when = when.replace(tzinfo = utc)
+    delta = when - _STORE_EPOCH
+    return delta.days * 86400 + delta.seconds
 
 def _str_cmp(a, b):
     """Because it looks like Python doesn't have one (?)"""
@@ -23,6 +72,48 @@ def _str_cmp(a, b):
     else:
         return 1
 
+class ContentStream:
+    """A read-only stream over content that is produced a chunk at a time.
+
+    Chunks are taken from an iterator only as they are read, so content that is
+    rendered as it is read never needs to be held in memory all at once.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+        self._offset = 0
+
+    def read(self, size = -1):
+        """Return up to size bytes of content, or all that remains if size is negative."""
+
+        if size < 0:
+            parts = [self._buffer[self._offset:]]
+            parts.extend(self._chunks)
+            self._buffer, self._offset = '', 0
+            return ''.join(parts)
+
+        while len(self._buffer) - self._offset < size:
+            try:
+                chunk = self._chunks.next()
+            except StopIteration:
+                break
+            self._buffer = self._buffer[self._offset:] + chunk
+            self._offset = 0
+
+        result = self._buffer[self._offset:self._offset + size]
+        self._offset += len(result)
+        return result
+
+    def getvalue(self):
+        """Return the content that has not been read yet: for a new stream, all of it."""
+
+        return self.read()
+
+    def close(self):
+        self._chunks = iter(())
+        self._buffer, self._offset = '', 0
+
 class Protocol:
     """A protocol is a method category within a Smalltalk class.
 
@@ -68,10 +159,13 @@ class Protocol:
 
 class Method:
     """Method is a light wrapper to organize source code.
+
+    source_id is the primary key of the method's source code in tw_blob.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, source_id = None):
         self.name = name
+        self.source_id = source_id
         self.source = None
 
     def set_source(self, source):
@@ -92,11 +186,12 @@ class SharedVariable:
     """Classes and Namespaces may define one or more shared-scope variables.
 
     Shared variables are presented as definitions within the content of their
-    environments.
+    environments.  definition_id is the primary key of the definition in tw_blob.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, definition_id = None):
         self.name = name
+        self.definition_id = definition_id
         self.definition = ''
 
     def set_definition(self, definition):
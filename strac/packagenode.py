@@ -7,7 +7,53 @@ from classnode import ClassNode
 from classextensionnode import ClassExtensionNode
 from namespacenode import NamespaceNode
 
-from node_util import _strac_decode, Method, Protocol, SharedVariable
+from node_util import Method, Protocol, SharedVariable
+
+class PackageManifest:
+    """The fully-qualified names of the namespaces, classes and class extensions in a package."""
+
+    NAMESPACE = NamespaceNode.entry_kind
+    CLASS = ClassNode.entry_kind
+    EXTENSION = ClassExtensionNode.entry_kind
+
+    def __init__(self, rows):
+        """Build a manifest from the (kind, fullname) rows of the package_manifest query.
+
+        Extension rows name every class that the package adds methods or shared variables
+        to, so those that the package also defines are classes rather than extensions.
+        """
+
+        self.namespaces = []
+        self.classes = []
+        self.extensions = []
+        self._kinds = {}
+
+        touched = []
+        for row in rows:
+            kind, fullname = row[0], row[1]
+            if kind == self.NAMESPACE:
+                self.namespaces.append(fullname)
+            elif kind == self.CLASS:
+                self.classes.append(fullname)
+            else:
+                touched.append(fullname)
+                continue
+            self._kinds[fullname] = kind
+
+        for fullname in touched:
+            if fullname not in self._kinds:
+                self.extensions.append(fullname)
+                self._kinds[fullname] = self.EXTENSION
+
+    def names(self):
+        """Return the fully-qualified names of every entry in the package."""
+
+        return self.namespaces + self.classes + self.extensions
+
+    def kind_of(self, fullname):
+        """Return the kind of the entry called fullname, or None if the package has no such entry."""
+
+        return self._kinds.get(fullname)
 
 class PackageNode(StoreNode):
     """A Package in the Store repository.
@@ -25,60 +71,86 @@ class PackageNode(StoreNode):
         Note that subnodes are constructed with the minimum possible database
         work: class definitions and method sources are not available for each
         entry.  To access a subnode for in-depth work, use subnode_named().
+
+        Once every subnode has been produced, the package is handed to the
+        repository's prefetcher, if it has one, to render its entries ahead of
+        time.
         """
 
-        # Start by finding the namespaces within this package.
-        for row in self.repos.sql("""
-            SELECT name, environmentstring FROM tw_pkgnamespacesview
-            WHERE packageref = %i
-            """ % self.id):
-            fullname = row[1] + '.' + row[0]
+        manifest = self.get_manifest()
+        for fullname in manifest.namespaces:
             yield NamespaceNode.just_named(fullname, self)
-
-        # Find the names of all classes that have methods defined by this
-        # package.  Filter out the metaclasses.
-        classes_touched = set()
-        for row in self.repos.sql("""
-            SELECT DISTINCT classname FROM tw_methodsview
-            WHERE packageref = %i
-            """ % self.id):
-            classname = row[0]
-            if classname.endswith(' class'):
-                classname = classname[:-6]
-            classes_touched.add(classname)
-
-        # Find the names of all shared variables that reside within classes
-        # in this package.
-        for row in self.repos.sql("""
-            SELECT DISTINCT environmentstring FROM tw_dataandsourcesview
-            WHERE typestring = 'C' AND packageref = %i
-            """ % self.id):
-            classname = row[0]
-            classes_touched.add(classname)
-
-        # Find classes defined within this package.  Yield a ClassNode for
-        # each and remember the yielded class names.
-        classes_defined = []
-        for row in self.repos.sql("""
-            SELECT name, environmentstring FROM tw_pkgclassesview
-            WHERE packageref = %i
-            """ % self.id):
-            fullname = row[1] + '.' + row[0]
-            classes_defined.append(fullname)
+        for fullname in manifest.classes:
             yield ClassNode.just_named(fullname, self)
+        for fullname in manifest.extensions:
+            yield ClassExtensionNode.just_named(fullname, self)
+
+        if self.repos.prefetcher != None:
+            self.repos.prefetcher.submit(self)
+
+    def get_manifest(self):
+        """Return the PackageManifest that lists everything within this package.
+
+        The manifest is read with a single query and kept in the repository's manifest
+        cache, keyed by this package version's primary key.
+        """
+
+        manifests = self.repos.caches.manifests
+        manifest = manifests.get(self.id)
+        if manifest == None:
+            manifest = PackageManifest(self.repos.query('package_manifest', (self.id,)))
+            manifests.put(self.id, manifest)
+        return manifest
+
+    def rendered_subnode_named(self, fullname):
+        """
+        Return a subnode, like subnode_named(), that is only guaranteed to be able to
+        produce its content.
+
+        If the subnode's rendered content is in the repository's content cache or render
+        store, the node is built from the cache without any database work; it will not know
+        its definition, methods or shared variables.  Otherwise, the source of its methods
+        is left to be fetched when, and if, its content needs to be rendered.
+        """
 
-        # Yield a ClassExtensionNode for each class name that didn't have a
-        # definition in this package.
-        for extended_class_name in [c for c in classes_touched if c not in classes_defined]:
-            yield ClassExtensionNode.just_named(extended_class_name, self)
+        entry = self.repos.caches.get_rendered((self.id, self._normalize_name(fullname)))
+        if entry == None:
+            return self._load_subnode(fullname)
+
+        kind, rendered = entry
+        node = _SUBNODE_CLASSES[kind].just_named(fullname, self)
+        node.rendered = rendered
+        return node
 
     def subnode_named(self, fullname):
         """
         Return a fully-initialized ClassNode, ClassExtensionNode, or
         NamespaceNode within this package and uniquely identified by
         a fully-qualified 'fullname'.
+
+        A class costs at most four queries: one each for its shared variables,
+        its instance- and class-side methods, and its definition, and a last
+        one for whichever of their source, definition and comment blobs are not
+        already in the repository's blob cache.  With a query pool, the first
+        three run at the same time.
+        """
+
+        node = self._load_subnode(fullname)
+        if node != None:
+            node.load_sources()
+        return node
+
+    def _load_subnode(self, fullname):
+        """
+        Private method used by subnode_named() to create the node called fullname,
+        knowing the blob ids, but not yet the text, of its contents.
+
+        If this package's manifest has already been loaded, it decides what kind
+        of node to look for, which saves probing for a namespace first.  The
+        queries that may be needed don't depend on each other, so they are
+        started together, to run at once if the repository has a query pool.
         """
-        
+
         # Prefix the fullname with a Root.Smalltalk. if it isn't there
         # already.
         if not fullname.startswith('Root.Smalltalk.'):
@@ -86,42 +158,49 @@ class PackageNode(StoreNode):
         parts = fullname.split('.')
         environment, class_name = '.'.join(parts[:-1]), parts[-1]
 
+        kind = None
+        manifest = self.repos.caches.manifests.get(self.id)
+        if manifest != None:
+            kind = manifest.kind_of(fullname)
+            if kind == None:
+                return None
+
+        metaclass_name = fullname + ' class'
+        queries = [('shared_variables', (self.id, fullname))]
+        if kind in (None, PackageManifest.NAMESPACE):
+            queries.append(('namespace_definition', (self.id, class_name, environment)))
+        queries.append(('methods_of_class', (self.id, fullname, metaclass_name)))
+        if kind in (None, PackageManifest.CLASS):
+            queries.append(('class_definition', (self.id, class_name, environment)))
+        results = self.repos.start_queries(queries)
+
         # Collect any shared variables declared in this environment (class or
         # namespace).
         svars = []
-        for row in self.repos.sql("""
-                SELECT name, blobdata FROM tw_dataandsourcesview
-                WHERE packageref = %i AND environmentstring = '%s'
-                """ % (self.id, fullname)):
-            name, definition = row[0], _strac_decode(row[1])
-            svar = SharedVariable(name)
-            svar.set_definition(definition)
-            svars.append(svar)
+        for row in results['shared_variables'].result():
+            name, definition_id = row[0], row[1]
+            svars.append(SharedVariable(name, definition_id))
 
         # Look for a Namespace with this name first.
-        for row in self.repos.sql("""
-                SELECT primarykey, commentid, blobdata FROM tw_pkgnamespacesandsourcesview
-                WHERE packageref = %i AND name = '%s' AND environmentstring = '%s'
-                """ % (self.id, class_name, environment)):
-            namespace_id, comment_id, definition = row[0], row[1], _strac_decode(row[2])
-            return NamespaceNode.fully_initialized(fullname, namespace_id, self,
-                                                   definition, comment_id, svars)
+        if kind in (None, PackageManifest.NAMESPACE):
+            for row in results['namespace_definition'].result():
+                namespace_id, comment_id, definition_id = row[0], row[1], row[2]
+                return NamespaceNode.fully_initialized(fullname, namespace_id, self,
+                                                       definition_id, comment_id, svars)
 
         # Collect instance- and class-side Methods defined for this class, within this package.
         # Organize them into Protocols.
-        iprotocols = self._get_protocols_for(fullname)
-        cprotocols = self._get_protocols_for(fullname + ' class')
-        
+        iprotocols, cprotocols = self._get_protocols_for(fullname,
+                                                         results['methods_of_class'].result())
+
         # Look for the class definition in tw_pkgclassesview.  If it's there, return the subnode
         # as a ClassNode.
-        for row in self.repos.sql("""
-                SELECT primarykey, commentid, blobdata FROM tw_pkgclassesandsourcesview
-                WHERE packageref = %i AND name = '%s' AND environmentstring = '%s'
-                """ % (self.id, class_name, environment)):
-            primarykey, comment_id, definition = row[0], row[1], _strac_decode(row[2])
-            return ClassNode.fully_initialized(fullname, primarykey, self,
-                definition, comment_id,
-                iprotocols, cprotocols, svars)
+        if kind in (None, PackageManifest.CLASS):
+            for row in results['class_definition'].result():
+                primarykey, comment_id, definition_id = row[0], row[1], row[2]
+                return ClassNode.fully_initialized(fullname, primarykey, self,
+                    definition_id, comment_id,
+                    iprotocols, cprotocols, svars)
 
         # If it isn't there, but we found some methods defined for this class
         # or a shared variable, return a ClassExtensionNode.
@@ -132,44 +211,33 @@ class PackageNode(StoreNode):
         # No methods or definitions found: return None.
         return None
 
-    def _get_protocols_for(self, class_name):
+    def _get_protocols_for(self, class_name, rows):
         """
-        Private method used by subnode_named() to fetch all methods defined within this
-        package for a class called class_name, organized in a structure of Protocols.
+        Private method used by subnode_named() to organize all methods defined within this
+        package for a class called class_name in a structure of Protocols.
+
+        rows are those of the methods_of_class query, which fetches the methods of both the
+        instance and class sides at once, without their source code.  Returns a tuple of the
+        instance-side and class-side protocols.
         """
 
-        protocols = {}
-        methods_by_source_id = {}
-        for row in self.repos.sql("""
-              SELECT primarykey, name, sourcecodeid, protocolname FROM tw_methodsview
-              WHERE packageref = %i AND classname = '%s'
-              """ % (self.id, class_name)):
-            method_id, method_name, source_id, protocol_name = row[0], row[1], row[2], row[3]
-            if protocol_name not in protocols:
-                protocols[protocol_name] = Protocol(protocol_name)
-
-            protocol = protocols[protocol_name]
-            method = Method(method_name)
-
-            protocol.add_method(method)
-            methods_by_source_id[source_id] = method
-
-        # Fetch the source code for all of these methods in a single query.
-        if len(methods_by_source_id) != 0:
-            id_str = ', '.join(str(id) for id in methods_by_source_id.keys())
-            for row in self.repos.sql("""
-                  SELECT primarykey, blobdata FROM tw_blob WHERE primarykey IN (%s)
-                  """ % id_str):
-                primarykey, source = row[0], _strac_decode(row[1])
-                methods_by_source_id[primarykey].set_source(source)
-
-        return protocols.values()
+        metaclass_name = class_name + ' class'
+        protocols = {class_name: {}, metaclass_name: {}}
+        for row in rows:
+            classname, method_name, protocol_name, source_id = row[0], row[1], row[2], row[3]
+            side = protocols[classname]
+            if protocol_name not in side:
+                side[protocol_name] = Protocol(protocol_name)
+
+            side[protocol_name].add_method(Method(method_name, source_id))
+
+        return protocols[class_name].values(), protocols[metaclass_name].values()
 
     @classmethod
     def with_id(cls, repos, id):
         """Fetch a PackageNode directly by its primary key."""
 
-        for row in repos.sql("SELECT primarykey, name, version FROM tw_package WHERE primarykey = %i" % id):
+        for row in repos.query('package_by_id', (id,)):
             primarykey, name, version = row[0], row[1], row[2]
             return cls('/' + name, version, repos, primarykey)
 
@@ -178,13 +246,17 @@ class PackageNode(StoreNode):
         """Return a Node for the package with the given name and revision, or None if none are found.
 
         If None is specified for the revision, the most recent revision of the package with this name
-        is located."""
+        is located in the repository's map of latest versions, which needs no query in the common
+        case."""
 
         if rev == None:
-            version_str = " ORDER BY timestamp DESC"
-        else:
-            version_str = " AND VERSION = '%s'" % rev
-        for row in repos.sql(("SELECT primarykey, name, version FROM tw_package WHERE name = '%s'" + version_str) % name):
+            latest = repos.caches.latest_packages.lookup(repos, name)
+            if latest == None:
+                return None
+            primarykey, version = latest
+            return cls('/' + name, version, repos, primarykey)
+
+        for row in repos.query('package_by_name', (name, rev)):
             primarykey, name, version = row[0], row[1], row[2]
             return cls('/' + name, version, repos, primarykey)
 
@@ -194,10 +266,7 @@ class PackageNode(StoreNode):
         matches 'pattern'.
         """
 
-        for row in repos.sql("""
-                 SELECT DISTINCT ON (name) primarykey, name, version
-                 FROM tw_package WHERE name LIKE '%s'
-                 ORDER BY name, timestamp DESC""" % pattern):
+        for row in repos.query('latest_packages_named_like', (pattern,), server_side = True):
             primarykey, name, version = row[0], row[1], row[2]
             yield cls('/' + name, version, repos, primarykey)
 
@@ -205,6 +274,13 @@ class PackageNode(StoreNode):
     def all(cls, repos):
         """Generate a collection of Nodes for the latest revisions of all known packages."""
 
-        for row in repos.sql("SELECT DISTINCT ON(name) primarykey, name, version FROM tw_package ORDER BY name, timestamp DESC"):
+        for row in repos.query('latest_packages', server_side = True):
             primarykey, name, version = row[0], row[1], row[2]
             yield cls('/' + name, version, repos, primarykey)
+
+# The node class for each kind of entry in a PackageManifest.
+_SUBNODE_CLASSES = {
+    PackageManifest.NAMESPACE: NamespaceNode,
+    PackageManifest.CLASS: ClassNode,
+    PackageManifest.EXTENSION: ClassExtensionNode,
+}
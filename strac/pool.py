@@ -0,0 +1,220 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+A small, thread-safe pool of Store database connections.
+
+Trac creates a new Repository for every request, so opening a fresh database
+connection each time means paying for a full handshake on every page view.
+The pool keeps warm connections around between requests instead.
+"""
+
+import threading
+import time
+
+class PooledConnection:
+    """A database connection on loan from a ConnectionPool.
+
+    Wraps the DB-API connection, remembering when it was last returned to the
+    pool, how many times the current thread has checked it out, and the names of
+    the statements that have been prepared on it.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_used = time.time()
+        self.depth = 0
+        self.prepared = set()
+
+    def cursor(self):
+        return self.connection.cursor()
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+class ConnectionPool:
+    """A bounded collection of database connections, shared among threads.
+
+    Each thread that calls checkout() receives a connection of its own; a thread
+    that checks out again before checking in receives the same connection back,
+    so nested repositories within a single request share it.  Connections that
+    have sat idle longer than idle_timeout seconds are closed rather than reused,
+    and idle connections are optionally tested with a trivial query before they
+    are handed out.
+    """
+
+    def __init__(self, connect, size = 5, idle_timeout = 300, health_check = True, log = None):
+        """Create an empty pool.
+
+        connect is a callable that takes no arguments and returns a new DB-API
+        connection.  At most size connections will be open at once; a thread that
+        asks for a connection when all of them are in use waits for one to be
+        returned.
+        """
+
+        self.connect = connect
+        self.size = max(size, 1)
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.log = log
+
+        self._idle = []
+        self._open = 0
+        self._available = threading.Condition(threading.Lock())
+        self._local = threading.local()
+
+        self.statistics = {}
+        self._statistics_lock = threading.Lock()
+
+    def checkout(self, wait = True):
+        """Return a PooledConnection for the exclusive use of the calling thread.
+
+        If wait is false and the calling thread would have to wait for a connection to be
+        returned, return None instead.
+        """
+
+        pooled = getattr(self._local, 'connection', None)
+        if pooled == None:
+            pooled = self._acquire(wait)
+            if pooled == None:
+                return None
+            self._local.connection = pooled
+        pooled.depth += 1
+        return pooled
+
+    def checkin(self, pooled):
+        """Return a connection obtained from checkout().
+
+        The connection goes back to the pool once every checkout made by this
+        thread has been matched by a checkin.
+        """
+
+        pooled.depth -= 1
+        if pooled.depth > 0:
+            return
+        self._local.connection = None
+
+        # End any transaction that the borrower left open, so that the
+        # connection doesn't sit "idle in transaction" on the server.
+        try:
+            pooled.rollback()
+        except Exception, e:
+            self._debug('Discarding connection that failed to roll back: %s' % e)
+            self._discard(pooled)
+            return
+
+        self._available.acquire()
+        try:
+            pooled.last_used = time.time()
+            self._idle.append(pooled)
+            self._available.notify()
+        finally:
+            self._available.release()
+
+    def close(self):
+        """Close every idle connection.  Connections still checked out are unaffected."""
+
+        self._available.acquire()
+        try:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._available.notifyAll()
+        finally:
+            self._available.release()
+
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+    def count(self, event):
+        """Add one to the tally of 'event' in statistics, such as statements prepared or executed."""
+
+        self._statistics_lock.acquire()
+        try:
+            self.statistics[event] = self.statistics.get(event, 0) + 1
+        finally:
+            self._statistics_lock.release()
+
+    def _acquire(self, wait = True):
+        """Take an idle connection from the pool, or open a new one if there's room.
+
+        If there is neither and wait is false, return None.
+        """
+
+        while True:
+            self._available.acquire()
+            try:
+                while not self._idle and self._open >= self.size:
+                    if not wait:
+                        return None
+                    self._available.wait()
+                if self._idle:
+                    # Reuse the most recently returned connection: it is the
+                    # least likely to have been timed out by the server.
+                    pooled = self._idle.pop()
+                else:
+                    pooled = None
+                    self._open += 1
+            finally:
+                self._available.release()
+
+            if pooled == None:
+                try:
+                    return PooledConnection(self.connect())
+                except:
+                    self._forget()
+                    raise
+
+            if time.time() - pooled.last_used > self.idle_timeout:
+                self._debug('Closing connection idle for more than %i seconds' % self.idle_timeout)
+                self._discard(pooled)
+            elif self.health_check and not self._is_healthy(pooled):
+                self._discard(pooled)
+            else:
+                return pooled
+
+    def _is_healthy(self, pooled):
+        """Run a trivial query on pooled to make sure that the server is still listening."""
+
+        try:
+            cursor = pooled.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            pooled.rollback()
+            return True
+        except Exception, e:
+            self._debug('Discarding connection that failed its health check: %s' % e)
+            return False
+
+    def _discard(self, pooled):
+        self._close_quietly(pooled)
+        self._forget()
+
+    def _forget(self):
+        """Give up one slot's worth of open connections, and wake a waiting thread."""
+
+        self._available.acquire()
+        try:
+            self._open -= 1
+            self._available.notify()
+        finally:
+            self._available.release()
+
+    def _close_quietly(self, pooled):
+        try:
+            pooled.close()
+        except Exception:
+            pass
+
+    def _debug(self, message):
+        if self.log != None:
+            self.log.debug(message)
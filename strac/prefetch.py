@@ -0,0 +1,74 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+Background rendering of the entries of packages that have just been listed.
+
+Someone who opens a package listing is likely to open one of its classes
+next.  Rendering them ahead of time, while the listing is read, means that the
+class is usually in the content cache by the time it is asked for.
+"""
+
+from cache import LRUCache
+from packagenode import PackageNode
+from workers import WorkerPool
+
+class Prefetcher:
+    """Renders the entries of listed packages into the content cache on a small WorkerPool.
+
+    repository_factory is called on a worker thread to create a StoreRepository, with a
+    pooled connection of its own, for each package.  A package is prefetched at most once
+    while it is among the last few hundred submitted, and is dropped if max_pending packages
+    are already waiting.  Prefetching a package stops once max_bytes of content have been
+    rendered for it.
+    """
+
+    def __init__(self, repository_factory, log, workers = 2, max_bytes = 4 * 1024 * 1024,
+                 max_pending = 8):
+        self.repository_factory = repository_factory
+        self.log = log
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.pool = WorkerPool(workers, 'strac-prefetch')
+        self._submitted = LRUCache(256)
+
+    def submit(self, package):
+        """Queue the entries of package, a PackageNode, for rendering, unless that was done already."""
+
+        if package.id in self._submitted or self.pool.pending() >= self.max_pending:
+            return None
+        self._submitted.put(package.id, True)
+        manifest = package.get_manifest()
+        # Classes are the likeliest to be opened next.
+        names = manifest.classes + manifest.extensions + manifest.namespaces
+        return self.pool.submit(self._prefetch, package.path, package.rev, package.id, names)
+
+    def _prefetch(self, path, rev, package_id, names):
+        """Render the entries called names, skipping those that are cached, and return how many were."""
+
+        repos = self.repository_factory()
+        try:
+            package = PackageNode(path, rev, repos, package_id)
+            rendered = 0
+            total = 0
+            for fullname in names:
+                if total >= self.max_bytes:
+                    break
+                key = (package_id, package._normalize_name(fullname))
+                if repos.caches.get_rendered(key) != None:
+                    continue
+                try:
+                    node = package.rendered_subnode_named(fullname)
+                    if node == None:
+                        continue
+                    node.get_content()
+                except Exception, e:
+                    self.log.warning('Unable to prefetch %s in %s: %s' % (fullname, path, e))
+                    continue
+                if node.rendered != None:
+                    total += len(node.rendered)
+                    rendered += 1
+            return rendered
+        finally:
+            repos.close()
@@ -0,0 +1,102 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+An on-disk store of rendered node content, shared by every Trac process.
+
+Under a forking web server each worker process starts with empty in-memory
+caches.  The render store keeps rendered content in an SQLite database file
+instead, so that content rendered by one process is available to the others.
+"""
+
+try:
+    import sqlite3
+except ImportError:
+    from pysqlite2 import dbapi2 as sqlite3
+
+import os
+import threading
+import zlib
+
+class RenderStore:
+    """Rendered content of classes, class extensions and namespaces, in an SQLite file.
+
+    Entries are keyed like the in-memory content cache, by the primary key of
+    a package version and the name of a node within it, and are compressed with
+    zlib.  Each thread uses a connection of its own, and SQLite's locking makes it
+    safe for several processes to read and write the file at once.
+    """
+
+    def __init__(self, path, log = None):
+        self.path = path
+        self.log = log
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, key):
+        """Return the (kind, content) tuple stored under key, or None if there isn't one."""
+
+        packageref, name = key
+        try:
+            row = self._connection().execute(
+                'SELECT kind, content FROM rendered WHERE packageref = ? AND name = ?',
+                (packageref, name)).fetchone()
+        except sqlite3.Error, e:
+            self._warn('Unable to read from the render store: %s' % e)
+            return None
+        if row == None:
+            return None
+        return (str(row[0]), zlib.decompress(str(row[1])))
+
+    def put(self, key, entry):
+        """Store the (kind, content) tuple entry under key.
+
+        If another process holds the database locked for longer than the connection's
+        timeout, the entry is silently not stored: it can always be rendered again.
+        """
+
+        packageref, name = key
+        kind, content = entry
+        connection = None
+        try:
+            connection = self._connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO rendered (packageref, name, kind, content) VALUES (?, ?, ?, ?)',
+                (packageref, name, kind, sqlite3.Binary(zlib.compress(content))))
+            connection.commit()
+        except sqlite3.Error, e:
+            if connection != None:
+                connection.rollback()
+            self._warn('Unable to write to the render store: %s' % e)
+
+    def _connection(self):
+        """Return this thread's connection to the database file, creating the file if necessary."""
+
+        connection = getattr(self._local, 'connection', None)
+        if connection == None:
+            connection = sqlite3.connect(self.path, timeout = 10)
+            connection.text_factory = str
+            try:
+                # Write-ahead logging lets readers proceed while another process writes.
+                connection.execute('PRAGMA journal_mode = WAL')
+            except sqlite3.Error:
+                pass
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS rendered (
+                    packageref INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    PRIMARY KEY (packageref, name))
+                """)
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def _warn(self, message):
+        if self.log != None:
+            self.log.warning(message)
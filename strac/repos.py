@@ -5,20 +5,36 @@
 # Implements the interfaces required for a Trac version control plugin, as
 # specified in trac/versioncontrol/api.py.
 
-from datetime import datetime
+from trac.core import Component, implements
 from trac.util.datefmt import utc
 
-from trac.core import Component, TracError, implements
-
-from trac.config import Option
+from trac.config import Option, IntOption, BoolOption
 
 from trac.versioncontrol.api import IRepositoryConnector, Repository, Node
-from trac.versioncontrol.api import Changeset, Authorizer
-from trac.versioncontrol.api import NoSuchChangeset, NoSuchNode, PermissionDenied
+from trac.versioncontrol.api import Changeset
+from trac.versioncontrol.api import NoSuchChangeset, NoSuchNode
 
 from rootnode import RootNode
 from bundlenode import BundleNode
 from packagenode import PackageNode
+from pool import ConnectionPool
+from node_util import _strac_decode_rows, _int_array, _store_time, _store_seconds
+from cache import StoreCaches
+from catalog import NameCatalog, VersionIndex
+from renderstore import RenderStore
+from revcache import RevisionCache
+from diff import PackageDiff
+from searchindex import SearchIndex
+from prefetch import Prefetcher
+from workers import WorkerPool, DeferredJob
+
+from datetime import datetime
+
+import copy
+import itertools
+import os
+import re
+import threading
 
 try:
     import pgdb
@@ -27,6 +43,254 @@ except ImportError:
 else:
     has_pgdb = True
 
+# Server-side cursors are named uniquely across every repository in the process,
+# since repositories within one thread share a pooled connection.
+_cursor_ids = itertools.count()
+
+# The connection that each query worker thread keeps checked out, by ConnectionPool.
+_query_workers = threading.local()
+
+# Every query that the node classes run, by name.  Each entry is a tuple of the
+# PostgreSQL types of the statement's parameters and its text, with parameters
+# written as $1, $2, ....  Statements are prepared once per pooled connection,
+# the first time they are used there, and executed with bound parameters.
+QUERIES = {
+    # Bundles.
+    'bundle_by_id': (('int4',), """
+        SELECT primarykey, name, version FROM tw_bundle WHERE primarykey = $1
+        """),
+    'bundle_by_name': (('text', 'text'), """
+        SELECT primarykey, name, version FROM tw_bundle WHERE name = $1 AND version = $2
+        """),
+    'latest_bundles': ((), """
+        SELECT DISTINCT ON (name) primarykey, name, version, timestamp FROM tw_bundle
+        ORDER BY name, timestamp DESC
+        """),
+    'bundles_since': (('int4',), """
+        SELECT primarykey, name, version, timestamp FROM tw_bundle WHERE primarykey > $1
+        """),
+    'bundle_versions': (('text',), """
+        SELECT primarykey, version, timestamp FROM tw_bundle WHERE name = $1
+        """),
+    'bundle_tree': (('int4',), """
+        WITH RECURSIVE subbundles (parentref, bundleref) AS (
+            SELECT bundleref, subbundleref FROM tw_bundles WHERE bundleref = $1
+          UNION
+            SELECT b.bundleref, b.subbundleref FROM tw_bundles b, subbundles s
+            WHERE b.bundleref = s.bundleref
+        )
+        SELECT s.parentref, 'B', b.primarykey, b.name, b.version
+        FROM subbundles s, tw_bundle b WHERE b.primarykey = s.bundleref
+        UNION ALL
+        SELECT c.bundleref, 'P', p.primarykey, p.name, p.version
+        FROM tw_packages c, tw_package p
+        WHERE p.primarykey = c.packageref
+          AND (c.bundleref = $1 OR c.bundleref IN (SELECT bundleref FROM subbundles))
+        """),
+
+    # Packages.
+    'package_by_id': (('int4',), """
+        SELECT primarykey, name, version FROM tw_package WHERE primarykey = $1
+        """),
+    'package_by_name': (('text', 'text'), """
+        SELECT primarykey, name, version FROM tw_package WHERE name = $1 AND version = $2
+        """),
+    'latest_packages': ((), """
+        SELECT DISTINCT ON (name) primarykey, name, version, timestamp FROM tw_package
+        ORDER BY name, timestamp DESC
+        """),
+    'packages_since': (('int4',), """
+        SELECT primarykey, name, version, timestamp FROM tw_package WHERE primarykey > $1
+        """),
+    'package_versions': (('text',), """
+        SELECT primarykey, version, timestamp FROM tw_package WHERE name = $1
+        """),
+    'latest_packages_named_like': (('text',), """
+        SELECT DISTINCT ON (name) primarykey, name, version FROM tw_package
+        WHERE name LIKE $1 ORDER BY name, timestamp DESC
+        """),
+
+    # Publications, newest first, for the timeline.  Pages of at most $5 rows are read
+    # by passing the (timestamp, kind, primarykey) of the last row of one page as $2, $3
+    # and $4 of the next, which keeps every page a range scan of the timestamp indexes.
+    'publications': (('int8', 'int8', 'text', 'int4', 'int4'), """
+        SELECT timestamp, kind, primarykey, name, version, username, commentid FROM (
+            SELECT timestamp, 'P'::text AS kind, primarykey, name, version, username, commentid
+            FROM tw_package WHERE timestamp BETWEEN $1 AND $2
+          UNION ALL
+            SELECT timestamp, 'B'::text, primarykey, name, version, username, commentid
+            FROM tw_bundle WHERE timestamp BETWEEN $1 AND $2
+        ) published
+        WHERE (timestamp, kind, primarykey) < ($2, $3, $4)
+        ORDER BY timestamp DESC, kind DESC, primarykey DESC LIMIT $5
+        """),
+    'publications_since': (('int8',), """
+        SELECT timestamp, kind, primarykey, name, version, username, commentid FROM (
+            SELECT timestamp, 'P'::text AS kind, primarykey, name, version, username, commentid
+            FROM tw_package WHERE timestamp >= $1
+          UNION ALL
+            SELECT timestamp, 'B'::text, primarykey, name, version, username, commentid
+            FROM tw_bundle WHERE timestamp >= $1
+        ) published
+        ORDER BY timestamp, kind, primarykey
+        """),
+    'package_publication': (('text', 'text'), """
+        SELECT timestamp, 'P', primarykey, name, version, username, commentid FROM tw_package
+        WHERE name = $1 AND version = $2
+        """),
+    'bundle_publication': (('text', 'text'), """
+        SELECT timestamp, 'B', primarykey, name, version, username, commentid FROM tw_bundle
+        WHERE name = $1 AND version = $2
+        """),
+
+    # The contents of a package.
+    'package_manifest': (('int4',), """
+        SELECT 'N', environmentstring || '.' || name FROM tw_pkgnamespacesview
+        WHERE packageref = $1
+        UNION
+        SELECT 'C', environmentstring || '.' || name FROM tw_pkgclassesview
+        WHERE packageref = $1
+        UNION
+        SELECT 'E', regexp_replace(classname, ' class$', '') FROM tw_methodsview
+        WHERE packageref = $1
+        UNION
+        SELECT 'E', environmentstring FROM tw_dataandsourcesview
+        WHERE typestring = 'C' AND packageref = $1
+        """),
+
+    # Individual classes and namespaces within a package.
+    'shared_variables': (('int4', 'text'), """
+        SELECT name, definitionid FROM tw_dataandsourcesview
+        WHERE packageref = $1 AND environmentstring = $2
+        """),
+    'namespace_definition': (('int4', 'text', 'text'), """
+        SELECT primarykey, commentid, definitionid FROM tw_pkgnamespacesandsourcesview
+        WHERE packageref = $1 AND name = $2 AND environmentstring = $3
+        """),
+    'class_definition': (('int4', 'text', 'text'), """
+        SELECT primarykey, commentid, definitionid FROM tw_pkgclassesandsourcesview
+        WHERE packageref = $1 AND name = $2 AND environmentstring = $3
+        """),
+    'methods_of_class': (('int4', 'text', 'text'), """
+        SELECT classname, name, protocolname, sourcecodeid FROM tw_methodsview
+        WHERE packageref = $1 AND classname IN ($2, $3)
+        """),
+
+    # Everything that makes up a class, class extension or namespace in every version of
+    # a package, as (packageref, part, blob id) rows: $1 is the package name, $2 and $3 the
+    # full names of the class and its metaclass, and $4 and $5 the class's name and
+    # environment.
+    'entry_history': (('text', 'text', 'text', 'text', 'text'), """
+        SELECT m.packageref, m.classname || ' ' || m.protocolname || ' ' || m.name, m.sourcecodeid
+        FROM tw_methodsview m, tw_package p
+        WHERE p.name = $1 AND m.packageref = p.primarykey AND m.classname IN ($2, $3)
+        UNION ALL
+        SELECT c.packageref, 'definition', c.definitionid
+        FROM tw_pkgclassesandsourcesview c, tw_package p
+        WHERE p.name = $1 AND c.packageref = p.primarykey AND c.name = $4 AND c.environmentstring = $5
+        UNION ALL
+        SELECT c.packageref, 'comment', c.commentid
+        FROM tw_pkgclassesandsourcesview c, tw_package p
+        WHERE p.name = $1 AND c.packageref = p.primarykey AND c.name = $4 AND c.environmentstring = $5
+        UNION ALL
+        SELECT n.packageref, 'definition', n.definitionid
+        FROM tw_pkgnamespacesandsourcesview n, tw_package p
+        WHERE p.name = $1 AND n.packageref = p.primarykey AND n.name = $4 AND n.environmentstring = $5
+        UNION ALL
+        SELECT n.packageref, 'comment', n.commentid
+        FROM tw_pkgnamespacesandsourcesview n, tw_package p
+        WHERE p.name = $1 AND n.packageref = p.primarykey AND n.name = $4 AND n.environmentstring = $5
+        UNION ALL
+        SELECT d.packageref, 'shared ' || d.name, d.definitionid
+        FROM tw_dataandsourcesview d, tw_package p
+        WHERE p.name = $1 AND d.packageref = p.primarykey AND d.environmentstring = $2
+        """),
+
+    # The parts of the entries of package version $1, as (entry, label, blob id) rows: each
+    # method, definition, comment and shared variable of each class, class extension and
+    # namespace.  package_parts_except leaves out those that package version $2 shares.
+    'package_parts': (('int4',), """
+        SELECT regexp_replace(classname, ' class$', ''),
+               classname || '>>' || name || ' {' || protocolname || '}', sourcecodeid
+        FROM tw_methodsview WHERE packageref = $1
+        UNION ALL
+        SELECT environmentstring || '.' || name, 'definition', definitionid
+        FROM tw_pkgclassesandsourcesview WHERE packageref = $1
+        UNION ALL
+        SELECT environmentstring || '.' || name, 'comment', commentid
+        FROM tw_pkgclassesandsourcesview WHERE packageref = $1
+        UNION ALL
+        SELECT environmentstring || '.' || name, 'definition', definitionid
+        FROM tw_pkgnamespacesandsourcesview WHERE packageref = $1
+        UNION ALL
+        SELECT environmentstring || '.' || name, 'comment', commentid
+        FROM tw_pkgnamespacesandsourcesview WHERE packageref = $1
+        UNION ALL
+        SELECT environmentstring, 'shared ' || name, definitionid
+        FROM tw_dataandsourcesview WHERE packageref = $1
+        """),
+    'package_parts_except': (('int4', 'int4'), """
+        (
+            SELECT regexp_replace(classname, ' class$', ''),
+                   classname || '>>' || name || ' {' || protocolname || '}', sourcecodeid
+            FROM tw_methodsview WHERE packageref = $1
+            UNION ALL
+            SELECT environmentstring || '.' || name, 'definition', definitionid
+            FROM tw_pkgclassesandsourcesview WHERE packageref = $1
+            UNION ALL
+            SELECT environmentstring || '.' || name, 'comment', commentid
+            FROM tw_pkgclassesandsourcesview WHERE packageref = $1
+            UNION ALL
+            SELECT environmentstring || '.' || name, 'definition', definitionid
+            FROM tw_pkgnamespacesandsourcesview WHERE packageref = $1
+            UNION ALL
+            SELECT environmentstring || '.' || name, 'comment', commentid
+            FROM tw_pkgnamespacesandsourcesview WHERE packageref = $1
+            UNION ALL
+            SELECT environmentstring, 'shared ' || name, definitionid
+            FROM tw_dataandsourcesview WHERE packageref = $1
+        ) EXCEPT (
+            SELECT regexp_replace(classname, ' class$', ''),
+                   classname || '>>' || name || ' {' || protocolname || '}', sourcecodeid
+            FROM tw_methodsview WHERE packageref = $2
+            UNION ALL
+            SELECT environmentstring || '.' || name, 'definition', definitionid
+            FROM tw_pkgclassesandsourcesview WHERE packageref = $2
+            UNION ALL
+            SELECT environmentstring || '.' || name, 'comment', commentid
+            FROM tw_pkgclassesandsourcesview WHERE packageref = $2
+            UNION ALL
+            SELECT environmentstring || '.' || name, 'definition', definitionid
+            FROM tw_pkgnamespacesandsourcesview WHERE packageref = $2
+            UNION ALL
+            SELECT environmentstring || '.' || name, 'comment', commentid
+            FROM tw_pkgnamespacesandsourcesview WHERE packageref = $2
+            UNION ALL
+            SELECT environmentstring, 'shared ' || name, definitionid
+            FROM tw_dataandsourcesview WHERE packageref = $2
+        )
+        """),
+
+    # Source code, comments and definitions.
+    'blobs': (('int4[]',), """
+        SELECT primarykey, blobdata FROM tw_blob WHERE primarykey = ANY ($1)
+        """),
+    'decoded_blobs': (('int4[]',), """
+        SELECT primarykey, translate(convert_from(decode(blobdata, 'base64'), 'UTF8'), E'\\r', E'\\n')
+        FROM tw_blob WHERE primarykey = ANY ($1)
+        """),
+}
+
+def _bind_placeholders(text, params):
+    """Replace the $n parameters in a QUERIES statement with DB-API placeholders.
+
+    Returns the rewritten statement and the params to bind to it, one for each
+    placeholder, since a statement may refer to the same $n more than once.
+    """
+
+    order = [int(number) - 1 for number in re.findall(r'\$(\d+)', text)]
+    return re.sub(r'\$\d+', '%s', text), tuple([params[i] for i in order])
+
 class StoreConnector(Component):
     """
     Component that registers the Store repository type with the Trac
@@ -54,8 +318,180 @@ class StoreConnector(Component):
        comma-separated list, or the special value ALL to include all packages.
        """)
 
+    connection_pool_size = IntOption('strac', 'connection_pool_size', 5,
+        """
+        Maximum number of database connections to keep open to the Store
+        repository.  Requests that find every connection in use wait for one
+        to be returned.
+        """)
+
+    connection_idle_timeout = IntOption('strac', 'connection_idle_timeout', 300,
+        """
+        Number of seconds that a pooled database connection may sit unused
+        before it is closed instead of being reused.
+        """)
+
+    connection_health_check = BoolOption('strac', 'connection_health_check', 'true',
+        """
+        Whether to test each pooled database connection with a trivial query
+        before handing it out.
+        """)
+
+    fetch_batch_size = IntOption('strac', 'fetch_batch_size', 256,
+        """
+        Number of rows to fetch from the database at a time.  Very large result
+        sets are read through a server-side cursor in batches of this size.
+        """)
+
+    bundle_tree_cache_size = IntOption('strac', 'bundle_tree_cache_size', 256,
+        """
+        Number of bundle versions whose complete tree of sub-bundles and
+        packages is kept in memory.
+        """)
+
+    package_manifest_cache_size = IntOption('strac', 'package_manifest_cache_size', 1024,
+        """
+        Number of package versions whose list of namespaces, classes and class
+        extensions is kept in memory.
+        """)
+
+    content_cache_size = IntOption('strac', 'content_cache_size', 1000,
+        """
+        Number of rendered classes, class extensions and namespaces to keep in
+        memory.
+        """)
+
+    render_store = Option('strac', 'render_store', '',
+        """
+        Path of an SQLite database file in which to keep rendered content, so
+        that it is shared by every Trac process.  Relative paths are relative
+        to the Trac environment directory.  Leave empty to keep rendered
+        content in memory only.
+        """)
+
+    latest_version_refresh = IntOption('strac', 'latest_version_refresh', 30,
+        """
+        Number of seconds between checks for newly published bundle and
+        package versions.  Until the next check, unversioned paths continue to
+        show the versions that were the latest at the previous one.
+        """)
+
+    blob_cache_size = IntOption('strac', 'blob_cache_size', 32,
+        """
+        Number of megabytes of decoded method source, definitions and comments
+        to keep in memory.
+        """)
+
+    fragment_cache_size = IntOption('strac', 'fragment_cache_size', 16,
+        """
+        Number of megabytes of rendered methods and classes to keep in memory
+        for reuse by later versions of the same package.
+        """)
+
+    history_cache_size = IntOption('strac', 'history_cache_size', 256,
+        """
+        Number of classes, class extensions and namespaces whose revision
+        log, and whose annotations, are kept in memory.
+        """)
+
+    version_index_cache_size = IntOption('strac', 'version_index_cache_size', 1024,
+        """
+        Number of bundles and packages whose list of published versions is
+        kept in memory, for stepping between revisions.
+        """)
+
+    server_side_decoding = BoolOption('strac', 'server_side_decoding', 'false',
+        """
+        Whether to have the database decode method source, definitions and
+        comments from base64, rather than Strac.  This requires the decoded
+        text in the Store repository to be valid UTF-8.
+        """)
+
+    stream_threshold = IntOption('strac', 'stream_threshold', 1000,
+        """
+        Classes and class extensions with more methods than this are rendered
+        as they are read, a protocol at a time, instead of all at once.  Their
+        rendered content is not kept in the content cache or render store.
+        """)
+
+    search_index_path = Option('strac', 'search_index', '',
+        """
+        Path of an SQLite database file in which to keep an index of the
+        words in the latest version of every package, for Trac's search page.
+        Relative paths are relative to the Trac environment directory.  Leave
+        empty to disable searching Store.
+        """)
+
+    revision_cache = BoolOption('strac', 'revision_cache', 'false',
+        """
+        Whether to copy Store publications into Trac's revision and
+        node_change tables, and read the timeline from there.  The first
+        copy is made by the trac-admin strac sync command; until then the
+        timeline is read from Store.  After that, new publications are copied
+        at most once every latest_version_refresh seconds, or by the command.
+        """)
+
+    prefetch_workers = IntOption('strac', 'prefetch_workers', 0,
+        """
+        Number of background threads that render the classes, class
+        extensions and namespaces of a package into the content cache once
+        it has been listed, so that opening one of them is quick.  Each
+        thread holds a pooled connection while it works.  Set to 0 to
+        disable prefetching.
+        """)
+
+    prefetch_size = IntOption('strac', 'prefetch_size', 4,
+        """
+        Number of megabytes of content to render ahead of time for each
+        listed package.
+        """)
+
+    query_workers = IntOption('strac', 'query_workers', 0,
+        """
+        Number of threads that run independent queries, such as those that
+        load a class, at the same time as each other on separate database
+        connections.  Each thread keeps a connection of its own, apart from
+        the connection_pool_size connections that requests share.  Queries run
+        one after another on the requesting thread's connection when no thread
+        is free.  Set to 0 to always run them one after another.
+        """)
+
     implements(IRepositoryConnector)
 
+    def __init__(self):
+        self._pool = None
+        self._query_connections = None
+        self._pool_lock = threading.Lock()
+        strac = self.config['strac']
+        render_store = None
+        if strac.get('render_store'):
+            render_store = RenderStore(os.path.join(self.env.path, strac.get('render_store')),
+                                       self.log)
+        self.caches = StoreCaches(strac.getint('bundle_tree_cache_size'),
+                                  strac.getint('package_manifest_cache_size'),
+                                  strac.getint('content_cache_size'),
+                                  render_store,
+                                  strac.getint('latest_version_refresh'),
+                                  strac.getint('blob_cache_size') * 1024 * 1024,
+                                  strac.getint('fragment_cache_size') * 1024 * 1024,
+                                  strac.getint('version_index_cache_size'),
+                                  strac.getint('history_cache_size'))
+        self.search_index = None
+        if strac.get('search_index'):
+            self.search_index = SearchIndex(os.path.join(self.env.path, strac.get('search_index')),
+                                            self.log, strac.getint('latest_version_refresh'))
+        self.revisions = None
+        if strac.getbool('revision_cache'):
+            self.revisions = RevisionCache(self.env, strac.getint('latest_version_refresh'))
+        self.query_pool = None
+        if strac.getint('query_workers') > 0:
+            self.query_pool = WorkerPool(strac.getint('query_workers'), 'strac-query')
+        self.prefetcher = None
+        if strac.getint('prefetch_workers') > 0:
+            self.prefetcher = Prefetcher(lambda: self.get_repository('store', '', None), self.log,
+                                         strac.getint('prefetch_workers'),
+                                         strac.getint('prefetch_size') * 1024 * 1024)
+
     # IRepositoryConnector required methods.
 
     def get_supported_types(self):
@@ -71,40 +507,168 @@ class StoreConnector(Component):
         connection_string = self.config['strac'].get('store_database_connection')
         root_store_bundles = self.config['strac'].get('root_store_bundles')
         root_store_packages = self.config['strac'].get('root_store_packages')
+        pool = self._get_pool(connection_string)
         return StoreRepository(connection_string, root_store_bundles,
-                               root_store_packages, None, self.log)
+                               root_store_packages, None, self.log,
+                               pool,
+                               self.config['strac'].getint('fetch_batch_size'),
+                               self.caches,
+                               self.config['strac'].getint('stream_threshold'),
+                               self.config['strac'].getbool('server_side_decoding'),
+                               self.revisions, self.prefetcher, self.query_pool,
+                               self._query_connections)
+
+    def _get_pool(self, connection_string):
+        """Return the connection pool shared by every repository this connector creates.
+
+        The query workers' connections, if there are any, are pooled apart from it the first
+        time, so that the connections they keep never leave requests waiting.
+        """
+
+        self._pool_lock.acquire()
+        try:
+            if self._pool == None:
+                strac = self.config['strac']
+                self._pool = ConnectionPool(lambda: pgdb.connect(connection_string),
+                                            strac.getint('connection_pool_size'),
+                                            strac.getint('connection_idle_timeout'),
+                                            strac.getbool('connection_health_check'),
+                                            self.log)
+                if self.query_pool != None:
+                    self._query_connections = ConnectionPool(lambda: pgdb.connect(connection_string),
+                                                             strac.getint('query_workers'),
+                                                             strac.getint('connection_idle_timeout'),
+                                                             strac.getbool('connection_health_check'),
+                                                             self.log)
+            return self._pool
+        finally:
+            self._pool_lock.release()
 
 class StoreRepository(Repository):
     """Mediates communications with the Store repository in a database."""
 
-    def __init__(self, connection_string, root_store_bundle, root_store_package, authz, log):
+    def __init__(self, connection_string, root_store_bundle, root_store_package, authz, log,
+                 pool = None, batch_size = 256, caches = None, stream_threshold = 1000,
+                 server_side_decoding = False, revisions = None, prefetcher = None,
+                 query_pool = None, query_connections = None):
         """Initialize the repository.
 
-        This call creates the database connection.  repos_name is expected to be a valid database
-        connection string.  One of root_store_bundle and root_store_package must specify what to
-        consider as the root of the Store repository view: if neither are provided, the full repository
-        will be visible.
+        This call borrows a database connection from pool, which the repository holds until it is
+        closed.  If no pool is given, a private single-connection pool is created.  connection_string
+        is expected to be a valid database connection string.  One of root_store_bundle and
+        root_store_package must specify what to consider as the root of the Store repository view: if
+        neither are provided, the full repository will be visible.  Query results are fetched
+        batch_size rows at a time.  caches holds the StoreCaches shared with other repositories in
+        this process; if it is omitted, the repository uses caches of its own.  Nodes with more than
+        stream_threshold methods render their content as it is read.  If server_side_decoding is
+        true, blobs are decoded by the database rather than in Python.  If revisions is given, it
+        is the RevisionCache from which changesets are read.  If prefetcher is given, it is the
+        Prefetcher that renders the entries of packages after they are listed.  If query_pool is
+        given, it is the WorkerPool on which start_queries() runs independent queries at once, on
+        connections from the ConnectionPool query_connections, or else from pool.
         """
         Repository.__init__(self, connection_string, authz, log)
-        self.connection = pgdb.connect(connection_string)
+        self.owns_pool = pool == None
+        if self.owns_pool:
+            pool = ConnectionPool(lambda: pgdb.connect(connection_string), 1, log = log)
+        self.pool = pool
+        self.connection = pool.checkout()
+        self.batch_size = max(batch_size, 1)
+        if caches == None:
+            caches = StoreCaches()
+        self.caches = caches
+        self.stream_threshold = stream_threshold
+        self.server_side_decoding = server_side_decoding
+        self.revisions = revisions
+        self.prefetcher = prefetcher
+        self.query_pool = query_pool
+        if query_connections == None:
+            query_connections = pool
+        self.query_connections = query_connections
         self.root = RootNode(self, root_store_bundle, root_store_package)
 
     def close(self):
-        self.connection.close()
+        """Hand the database connection back to the pool."""
+
+        if self.connection != None:
+            self.pool.checkin(self.connection)
+            self.connection = None
+            if self.owns_pool:
+                self.pool.close()
 
     def clear(self, youngest_rev = None):
         pass
 
     def get_changeset(self, rev):
-        # Temporary stub
-        return StoreChangeset.working_on_it()
+        """Return the StoreChangeset for the publication identified by rev, a 'name@version' string.
+
+        Nodes carry the plain version of their bundle or package as their rev, and Trac asks
+        for the changeset of that too.  A plain version doesn't say which bundle or package
+        published it, so it gets a stand-in changeset from StoreChangeset.unpublished().
+        """
+
+        name, version = StoreChangeset.split_rev(rev)
+        if name == None and rev != None:
+            return StoreChangeset.unpublished(rev)
+
+        if self.revisions != None:
+            self.revisions.sync(self)
+            try:
+                return self.revisions.get_changeset(rev)
+            except NoSuchChangeset:
+                # It may have been published since the last sync.
+                pass
+
+        if name != None:
+            # Bundles take precedence over packages of the same name, as in get_node().
+            for kind in self.caches.names.kinds_of(self, name):
+                if kind == NameCatalog.BUNDLE:
+                    rows = self.query('bundle_publication', (name, version))
+                else:
+                    rows = self.query('package_publication', (name, version))
+                for changeset in self._changesets(list(rows)):
+                    return changeset
+        raise NoSuchChangeset(rev)
 
     def get_changesets(self, start, stop):
-        # Temporary stub (needed so that the Timeline component won't break horribly)
-        return []
+        """Generate a StoreChangeset for each bundle or package published between start and stop.
+
+        start and stop are datetimes or, as time.time() returns, seconds since 1970.  Changesets
+        are produced newest first, from pages of batch_size publications: each page costs one
+        range query, and one more for the comments of all of its publications.  If this
+        repository has a RevisionCache that has been filled, the changesets are read from Trac's
+        database instead.
+        """
+
+        if self.revisions != None:
+            self.revisions.sync(self)
+            if self.revisions.synced:
+                for changeset in self.revisions.get_changesets(start, stop):
+                    yield changeset
+                return
+
+        first, last = _store_seconds(start), _store_seconds(stop)
+        # Every publication at the last second sorts before this key.
+        key = (last, 'Z', 0)
+        while True:
+            rows = list(self.query('publications', (first,) + key + (self.batch_size,)))
+            for changeset in self._changesets(rows):
+                yield changeset
+            if len(rows) < self.batch_size:
+                return
+            key = (rows[-1][0], rows[-1][1], rows[-1][2])
+
+    def _changesets(self, rows):
+        """Return a StoreChangeset for each row of a publications query, with their comments."""
+
+        comments = self.get_blobs([row[6] for row in rows])
+        return [StoreChangeset.published(row, comments.get(row[6], '')) for row in rows]
 
     def get_node(self, path, rev = None):
-        """Return a StoreNode subclass appropriate to handle the resource at path and rev."""
+        """Return a StoreNode subclass appropriate to handle the resource at path and rev.
+
+        rev may also be the rev of a StoreChangeset, in which case its version is used.
+        """
 
         # Case 1: Root
         if not path or path == '/': return self.root
@@ -112,46 +676,236 @@ class StoreRepository(Repository):
         parts = path.split('/')
         if parts[0] == '': parts = parts[1:]
 
-        # Workaround to deal with us wanting to use None revisions
-        # in places where unicode() is used
-        if rev == 'None': rev = None
+        rev = self._version_of(rev)
 
         if len(parts) == 1:
-            # Case 2: /BundleName
-            bundle = BundleNode.with_name(self, parts[0], rev)
-            if bundle != None: return bundle
-
-            # Case 3: /PackageName
-            package = PackageNode.with_name(self, parts[0], rev)
-            if package != None: return package            
+            # Only look up the kinds of entity that the catalog knows by this name.
+            kinds = self.caches.names.kinds_of(self, parts[0])
+            if not kinds:
+                # The name may have been published since the catalog was last refreshed.
+                self.caches.latest_bundles.invalidate()
+                self.caches.latest_packages.invalidate()
+                kinds = self.caches.names.kinds_of(self, parts[0])
+            for kind in kinds:
+                if kind == NameCatalog.BUNDLE:
+                    # Case 2: /BundleName
+                    node = BundleNode.with_name(self, parts[0], rev)
+                else:
+                    # Case 3: /PackageName
+                    node = PackageNode.with_name(self, parts[0], rev)
+                if node != None: return node
         else:
             # Case 4: /PackageName/Fully.Qualified.ClassName
             package = PackageNode.with_name(self, parts[-2], rev)
+            if package == None and rev == None:
+                self.caches.latest_packages.invalidate()
+                package = PackageNode.with_name(self, parts[-2], rev)
             if package != None:
-                subnode = package.subnode_named(parts[-1])
+                subnode = package.rendered_subnode_named(parts[-1])
                 if subnode != None: return subnode
         raise NoSuchNode(path, rev)
 
     def get_oldest_rev(self):
-        # Temporary stub.
+        """Return None: Store versions each bundle and package separately, so no single
+        revision is the oldest, or the youngest, of the whole repository."""
+
         return None
 
     def get_youngest_rev(self):
-        # Temporary stub.
         return None
 
-    def previous_rev(self, rev):
-        pass
+    def previous_rev(self, rev, path = ''):
+        """Return the version of the bundle or package named by rev or path that was published before rev.
+
+        rev is either a version of the bundle or package at path, or a changeset rev, which
+        names its bundle or package itself and is answered with another changeset rev.
+        """
+
+        return self._step(rev, path, VersionIndex.previous)
 
     def next_rev(self, rev, path = ''):
-        pass
+        """Return the version published after rev, as previous_rev() does the one before."""
+
+        return self._step(rev, path, VersionIndex.next)
 
     def rev_older_than(self, rev1, rev2):
-        pass
+        """Answer whether rev1 was published before rev2.
+
+        Only changeset revs, which name their bundle or package, can be compared.
+        """
+
+        name1, version1 = StoreChangeset.split_rev(rev1)
+        name2, version2 = StoreChangeset.split_rev(rev2)
+        if name1 == None or name2 == None:
+            return False
+        index1, index2 = self._version_index(name1), self._version_index(name2)
+        if index1 == None or index2 == None:
+            return False
+        if name1 == name2:
+            return index1.older_than(version1, version2)
+        timestamp1, timestamp2 = index1.timestamp_of(version1), index2.timestamp_of(version2)
+        return timestamp1 != None and timestamp2 != None and timestamp1 < timestamp2
+
+    def _step(self, rev, path, step):
+        """Return the version next to rev, in the direction of the VersionIndex method step."""
+
+        name, version = StoreChangeset.split_rev(rev)
+        if name == None:
+            path = self.normalize_path(path)
+            if rev == None or path == '/':
+                return None
+            name, version = path.split('/')[1], rev
+
+        index = self._version_index(name)
+        if index == None:
+            return None
+        neighbour = step(index, version)
+        if neighbour == None or rev == version:
+            return neighbour
+        return name + '@' + neighbour
+
+    def _version_index(self, name):
+        """Return the VersionIndex of the bundle, or else the package, called name, or None."""
+
+        for kind in self.caches.names.kinds_of(self, name):
+            return self.caches.version_index(self, kind, name)
+        return None
 
     def get_path_history(self, path, rev = None, limit = None):
-        # Temporary stub
-        return [(path, rev, StoreChangeset.EDIT)]
+        """Generate a (path, rev, change) tuple for each version that changed path, newest first.
+
+        The log starts at rev, or at the latest version if rev is None, and stops after limit
+        entries if limit is given.  Every version of a bundle or package changes it.  A class,
+        class extension or namespace changes in the versions of its package in which any of its
+        methods, definition, comment or shared variables differ from the version before.  Their
+        contents in every version of the package are read with a single query and cached.
+
+        Each rev is the changeset rev of a version of the bundle or package that path is, or is
+        within, so that the log shows the publication that made the change.
+        """
+
+        path = self.normalize_path(path)
+        if path == '/':
+            yield (path, self.root.rev, Changeset.ADD)
+            return
+
+        parts = path.split('/')[1:]
+        rev = self._version_of(rev)
+        if len(parts) == 1:
+            index = self._version_index(parts[0])
+        elif NameCatalog.PACKAGE in self.caches.names.kinds_of(self, parts[0]):
+            index = self.caches.version_index(self, NameCatalog.PACKAGE, parts[0])
+        else:
+            index = None
+        if index == None or len(index) == 0:
+            return
+
+        if rev == None:
+            rev = index.youngest()
+        position = index.position(rev)
+        if position == None:
+            return
+
+        if len(parts) == 1:
+            changes = self._version_changes(index, position)
+        else:
+            changes = self._entry_changes(parts[0], parts[1], index, position)
+
+        count = 0
+        for version, change in changes:
+            yield (path, parts[0] + '@' + version, change)
+            count += 1
+            if limit and count >= limit:
+                return
+
+    def _version_changes(self, index, position):
+        """Generate a (version, change) pair for every version of index from position back."""
+
+        for position in range(position, -1, -1):
+            if position == 0:
+                yield index.versions[position], Changeset.ADD
+            else:
+                yield index.versions[position], Changeset.EDIT
+
+    def _entry_changes(self, package, entry, index, position):
+        """Generate (version, change) pairs for the versions of package, from position back, that
+        changed the class, class extension or namespace called entry."""
+
+        contents = self._entry_contents(package, entry, index)
+        empty = frozenset()
+        for position in range(position, -1, -1):
+            current = contents.get(index.primarykeys[position], empty)
+            previous = empty
+            if position > 0:
+                previous = contents.get(index.primarykeys[position - 1], empty)
+            if current == previous:
+                continue
+            if not previous:
+                yield index.versions[position], Changeset.ADD
+            elif not current:
+                yield index.versions[position], Changeset.DELETE
+            else:
+                yield index.versions[position], Changeset.EDIT
+
+    def get_entry_origins(self, package, entry, rev):
+        """Return a dictionary that maps the blob id of each part of the entry called entry, as of
+        version rev of package, to the oldest version of the package that included that blob.
+
+        The oldest version that included the entry at all is mapped from None.  The answer is
+        worked out from the contents of the entry in every version, as read by _entry_contents().
+        """
+
+        if NameCatalog.PACKAGE not in self.caches.names.kinds_of(self, package):
+            return {}
+        index = self.caches.version_index(self, NameCatalog.PACKAGE, package)
+        last = index.position(rev)
+        if last == None:
+            return {}
+
+        contents = self._entry_contents(package, entry, index)
+        current = contents.get(index.primarykeys[last], frozenset())
+        wanted = set([blob_id for part, blob_id in current])
+        origins = {}
+        for position in range(last + 1):
+            parts = contents.get(index.primarykeys[position])
+            if not parts:
+                continue
+            if None not in origins:
+                origins[None] = index.versions[position]
+            for part, blob_id in parts:
+                if blob_id in wanted and blob_id not in origins:
+                    origins[blob_id] = index.versions[position]
+        return origins
+
+    def _entry_contents(self, package, entry, index):
+        """Return a dictionary that maps the primary key of each version of package to a frozenset
+        of the (part, blob id) pairs that make up the entry called entry in that version.
+
+        The dictionary is cached until index, the package's VersionIndex, is reloaded.
+        """
+
+        key = (package, entry)
+        cached = self.caches.histories.get(key)
+        if cached != None and cached[0] is index:
+            return cached[1]
+
+        fullname = entry
+        if not fullname.startswith('Root.Smalltalk.'):
+            fullname = 'Root.Smalltalk.' + fullname
+        parts = fullname.split('.')
+        environment, class_name = '.'.join(parts[:-1]), parts[-1]
+
+        parts_by_version = {}
+        params = (package, fullname, fullname + ' class', class_name, environment)
+        for row in self.query('entry_history', params, server_side = True):
+            packageref, part, blob_id = row[0], row[1], row[2]
+            parts_by_version.setdefault(packageref, []).append((part, blob_id))
+
+        contents = {}
+        for packageref, parts in parts_by_version.items():
+            contents[packageref] = frozenset(parts)
+        self.caches.histories.put(key, (index, contents))
+        return contents
 
     def normalize_path(self, path):
         """Construct a canonical representation of a Store path.
@@ -171,7 +925,7 @@ class StoreRepository(Repository):
             parts[0:1] = []
         last = parts[-1]
 
-        if PackageNode.with_name(self, last) != None or PackageNode.with_name(self, last) != None:
+        if self.caches.names.kinds_of(self, last):
             # Bundle/Package or Bundle/Bundle ... all but the last element are unnecessary.
             return '/' + last
         else:
@@ -187,39 +941,334 @@ class StoreRepository(Repository):
         return rev
 
     def get_changes(self, old_path, old_rev, new_path, new_rev, ignore_ancestry = 1):
-        # Temporary stub
-        old = self.get_node(old_path, old_rev)
-        new = self.get_node(new_path, new_rev)
-        return [(old, new, StoreChangeset.EDIT, StoreChangeset.working_on_it(new_rev))]
+        """Generate (old_node, new_node, kind, change) tuples for what differs between two paths.
+
+        Two versions of a package, or of a class, class extension or namespace, are compared
+        method by method by a PackageDiff, and each entry that differs is produced as a pair of
+        DiffNodes that hold only the differing parts.  Two versions of a bundle are compared
+        package by package: packages at different versions are compared as above, and those
+        found on only one side are produced as added or deleted directories.
+        """
+
+        old_path, new_path = self.normalize_path(old_path), self.normalize_path(new_path)
+        old_parts, new_parts = old_path.split('/')[1:], new_path.split('/')[1:]
+
+        if len(old_parts) == 2 and len(new_parts) == 2:
+            old_package = PackageNode.with_name(self, old_parts[0], self._version_of(old_rev))
+            new_package = PackageNode.with_name(self, new_parts[0], self._version_of(new_rev))
+            if old_package == None or new_package == None:
+                raise NoSuchNode(old_package == None and old_path or new_path,
+                                 old_package == None and old_rev or new_rev)
+            fullname = new_parts[1]
+            if not fullname.startswith('Root.Smalltalk.'):
+                fullname = 'Root.Smalltalk.' + fullname
+            return PackageDiff(self, old_package, new_package).get_changes(fullname)
+
+        old, new = self.get_node(old_path, old_rev), self.get_node(new_path, new_rev)
+        if isinstance(old, PackageNode) and isinstance(new, PackageNode):
+            return PackageDiff(self, old, new).get_changes()
+        if isinstance(old, BundleNode) and isinstance(new, BundleNode):
+            return self._bundle_changes(old, new)
+        return [(old, new, new.kind, Changeset.EDIT)]
+
+    def _bundle_changes(self, old, new):
+        """Return the changes between every package within two bundle versions."""
+
+        old_packages, new_packages = self._packages_within(old), self._packages_within(new)
+        changes = []
+        for name in sorted(set(old_packages.keys()) | set(new_packages.keys())):
+            old_package, new_package = old_packages.get(name), new_packages.get(name)
+            if old_package == None:
+                changes.append((None, new_package, Node.DIRECTORY, Changeset.ADD))
+            elif new_package == None:
+                changes.append((old_package, None, Node.DIRECTORY, Changeset.DELETE))
+            elif old_package.id != new_package.id:
+                changes.extend(PackageDiff(self, old_package, new_package).get_changes())
+        return changes
+
+    def _packages_within(self, bundle):
+        """Return a dictionary of a PackageNode for every package within bundle, however deeply, by name."""
+
+        # The cached tree may be that of a bundle that contains this one, so walk it only
+        # from this bundle down.
+        tree = bundle.get_tree()
+        packages = {}
+        pending = [bundle.id]
+        seen = set(pending)
+        while pending:
+            for kind, primarykey, name, version in tree.get(pending.pop(), []):
+                if kind == 'P':
+                    packages[name] = PackageNode('/' + name, version, self, primarykey)
+                elif primarykey not in seen:
+                    seen.add(primarykey)
+                    pending.append(primarykey)
+        return packages
+
+    def _version_of(self, rev):
+        """Return the version in rev, which may be a changeset rev."""
+
+        # Workaround to deal with us wanting to use None revisions
+        # in places where unicode() is used
+        if rev == 'None':
+            return None
+        published_name, published_version = StoreChangeset.split_rev(rev)
+        if published_name != None:
+            return published_version
+        return rev
+
+    def get_blobs(self, ids):
+        """Return a dictionary of the decoded contents of the tw_blob rows with primary keys ids.
+
+        Decoded blobs are kept in the repository's blob cache: a blob never changes once it
+        has been written, and the same blob is shared by every package version that contains
+        it.  Only the blobs missing from the cache are fetched, in a single query, and they are
+        decoded together by _strac_decode_rows().  Ids of 0 or None, which Store uses for "no
+        blob", are ignored.
+        """
+
+        cache = self.caches.blobs
+        blobs = {}
+        missing = set()
+        for id in ids:
+            if id and id not in blobs:
+                blob = cache.get(id)
+                if blob == None:
+                    missing.add(id)
+                else:
+                    blobs[id] = blob
+
+        if missing:
+            fetched = self.fetch_blobs(missing)
+            for primarykey, blob in fetched.iteritems():
+                cache.put(primarykey, blob)
+            blobs.update(fetched)
+        return blobs
 
-    def sql(self, string):
-       """Generator over the results of executing the SQL 'string'."""
+    def fetch_blobs(self, ids):
+        """Return a dictionary of the decoded contents of the tw_blob rows with primary keys ids.
+
+        Unlike get_blobs(), this always fetches every blob, with a single query, and leaves the
+        blob cache alone: it suits bulk reads of blobs that are unlikely to be displayed.
+        """
+
+        if self.server_side_decoding:
+            rows = self.query('decoded_blobs', (_int_array(ids),), server_side = True)
+        else:
+            rows = self.query('blobs', (_int_array(ids),), server_side = True)
+        return _strac_decode_rows(rows, self.server_side_decoding)
+
+    def start_queries(self, queries):
+        """Return a dictionary that maps the name of each (name, params) pair in queries to a Job
+        whose result is a list of the query's rows.
+
+        Without a query pool, each query runs on this repository's connection when its result
+        is first asked for, so queries whose results are never wanted cost nothing.  With one,
+        every query but the first is sent at once by a worker, on a pooled connection of its
+        own, and the first runs here meanwhile: waiting for them all takes about as long as the
+        slowest.  A query that no worker has started by the time its result is wanted, or for
+        which the pool has no connection to spare, runs here instead.
+        """
+
+        jobs = {}
+        for position, (name, params) in enumerate(queries):
+            if self.query_pool == None or position == 0:
+                jobs[name] = DeferredJob(self._rows, (name, params))
+            else:
+                elsewhere = self.query_pool.submit(self._rows_elsewhere, name, params)
+                jobs[name] = DeferredJob(self._rows, (name, params, elsewhere))
+        return jobs
+
+    def _rows(self, name, params, elsewhere = None):
+        """Return the rows of a query, as run by the Job elsewhere if it managed to run it.
+
+        If no worker has started elsewhere yet, the query runs here instead of waiting for one.
+        """
+
+        if elsewhere != None and not elsewhere.claim():
+            rows = elsewhere.result()
+            if rows != None:
+                return rows
+        return list(self.query(name, params))
+
+    def _rows_elsewhere(self, name, params):
+        """Return the rows of a query run on a worker's own pooled connection, or None if it has none.
+
+        A worker keeps the connection it checks out of query_connections for the jobs that
+        follow, so that they don't each pay for the pool's health check, and so that the
+        statements prepared on it are reused.  The transaction is rolled back after each job, so
+        that the connection doesn't sit "idle in transaction" between them.  A connection that
+        fails is handed back, and the query is left to the requesting thread.
+        """
+
+        connections = self.query_connections
+        held = getattr(_query_workers, 'connections', None)
+        if held == None:
+            held = _query_workers.connections = {}
+        connection = held.get(connections)
+        if connection == None:
+            connection = connections.checkout(False)
+            if connection == None:
+                return None
+            held[connections] = connection
+
+        other = copy.copy(self)
+        other.connection = connection
+        try:
+            rows = list(other.query(name, params))
+            connection.rollback()
+            return rows
+        except Exception, e:
+            self.log.debug('Query %s failed on a query worker, retrying it in place: %s' % (name, e))
+            del held[connections]
+            connections.checkin(connection)
+            return None
+
+    def query(self, name, params = (), server_side = False):
+        """Generator over the results of executing the statement called 'name' in QUERIES.
+
+        params are bound to the statement's parameters in order.  The statement is prepared
+        on this repository's connection the first time it is used there.  Queries run with
+        server_side, as in sql(), are planned each time: PostgreSQL cannot declare a cursor
+        over a prepared statement.
+        """
+
+        types, text = QUERIES[name]
+        if server_side:
+            text, params = _bind_placeholders(text, params)
+            return self.sql(text, params, server_side = True)
+
+        statement = 'strac_' + name
+        if statement not in self.connection.prepared:
+            self._prepare(statement, types, text)
+        self.pool.count('executed')
+        if params:
+            return self.sql('EXECUTE %s (%s)' % (statement, ', '.join(['%s'] * len(params))), params)
+        return self.sql('EXECUTE ' + statement)
+
+    def _prepare(self, statement, types, text):
+        """Prepare the QUERIES entry text as 'statement' on this repository's connection."""
+
+        if types:
+            signature = '%s (%s)' % (statement, ', '.join(types))
+        else:
+            signature = statement
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('PREPARE %s AS %s' % (signature, text))
+        finally:
+            cursor.close()
+        self.connection.prepared.add(statement)
+        self.pool.count('prepared')
+        self.log.debug('Prepared statement %s' % statement)
+
+    def sql(self, string, params = None, server_side = False):
+       """Generator over the results of executing the SQL 'string'.
+
+       If params is given, its values are bound to the DB-API placeholders in string.
+       Rows are fetched batch_size at a time.  If server_side is true, the query runs
+       within a server-side cursor so that only one batch of a very large result set is
+       held in memory at once; otherwise the database driver receives the full result
+       before the first row is produced.
+       """
 
        cursor = self.connection.cursor()
        try:
-           cursor.execute(string)
-           for i in range(cursor.rowcount):
-               yield cursor.fetchone()
+           if server_side:
+               rows = self._server_side_rows(cursor, string, params)
+           elif params:
+               cursor.execute(string, params)
+               rows = self._batched_rows(cursor)
+           else:
+               cursor.execute(string)
+               rows = self._batched_rows(cursor)
+           for row in rows:
+               yield row
        finally:
            cursor.close()
 
+    def _batched_rows(self, cursor):
+        """Generate the rows of an executed cursor, fetching them batch_size at a time."""
+
+        while True:
+            batch = cursor.fetchmany(self.batch_size)
+            if not batch:
+                return
+            for row in batch:
+                yield row
+
+    def _server_side_rows(self, cursor, string, params):
+        """Generate the rows of the query 'string' through a server-side cursor."""
+
+        name = 'strac_cursor_%i' % _cursor_ids.next()
+        declare = 'DECLARE %s NO SCROLL CURSOR FOR %s' % (name, string)
+        if params:
+            cursor.execute(declare, params)
+        else:
+            cursor.execute(declare)
+        try:
+            fetch = 'FETCH FORWARD %i FROM %s' % (self.batch_size, name)
+            while True:
+                cursor.execute(fetch)
+                batch = cursor.fetchall()
+                for row in batch:
+                    yield row
+                if len(batch) < self.batch_size:
+                    return
+        finally:
+            try:
+                cursor.execute('CLOSE %s' % name)
+            except pgdb.Error:
+                # The transaction has been aborted, which closes the cursor anyway.
+                pass
+
 class StoreChangeset(Changeset):
-    """One 'publishing' of a package to Store.
+    """One 'publishing' of a package or bundle to Store.
 
-    Contains information such as blessings and comments.
+    The rev of a publication is the name of the package or bundle and the version that
+    was published, joined by an '@'.  Its message is the comment given when it was
+    published.
     """
 
     def get_changes(self):
-        # Temporary stub.
-        return []
+        """Generate the published package or bundle, as a directory that was added."""
+
+        name, version = self.split_rev(self.rev)
+        if name != None:
+            yield ('/' + name, Node.DIRECTORY, Changeset.ADD, None, -1)
 
     def get_properties(self):
-        # Temporary stub.
         return {}
 
     @classmethod
-    def working_on_it(cls, rev = None):
-        return cls(rev, 
-                   "Changeset support is not yet implemented in Strac.  I'm working on it!",
-                   'smash',
-                   datetime.now(utc))
+    def split_rev(cls, rev):
+        """Return the name and version in a changeset rev, or (None, None) if it doesn't have them."""
+
+        if rev == None or '@' not in rev:
+            return None, None
+        name, version = rev.rsplit('@', 1)
+        return name, version
+
+    @classmethod
+    def unpublished(cls, rev):
+        """Create a stand-in changeset for rev, a plain version that names no bundle or package.
+
+        It changes nothing, and its date is the time it was asked for.
+        """
+
+        return cls(rev, 'Version %s.  See the log of a bundle or package for its publications.' % rev,
+                   '', datetime.now(utc))
+
+    @classmethod
+    def published(cls, row, comment):
+        """Create the changeset for a row of the publications query.
+
+        The row holds the Store timestamp, kind ('P' or 'B'), primary key, name, version and
+        publishing user of a package or bundle version.
+        """
+
+        timestamp, kind, primarykey, name, version, username = \
+            row[0], row[1], row[2], row[3], row[4], row[5]
+        changeset = cls(name + '@' + version, comment, username or '', _store_time(timestamp))
+        changeset.kind = kind
+        changeset.id = primarykey
+        return changeset
@@ -0,0 +1,250 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+A copy of Store's publication history in Trac's own database.
+
+Trac keeps the history of cached repositories in its revision and node_change
+tables.  Copying Store publications into the same tables lets the timeline be
+read from Trac's database, without querying Store at all.
+
+Trac 0.12 added a repos column, the id of the repository, to both tables and
+stores revision times in microseconds rather than seconds.  Rows are written
+in whichever layout the environment's Trac uses.
+"""
+
+from datetime import datetime
+from trac.util.datefmt import utc, to_timestamp
+
+from trac.versioncontrol.api import Node, Changeset, NoSuchChangeset
+
+import repos
+
+import threading
+import time
+
+# The name of the row in Trac's system table that holds the Store timestamp of the
+# newest publication copied so far.
+SYNCED_KEY = 'strac_synced_timestamp'
+
+_KINDS = {Node.DIRECTORY: 'D', Node.FILE: 'F'}
+_CHANGES = {Changeset.ADD: 'A', Changeset.COPY: 'C', Changeset.DELETE: 'D',
+            Changeset.EDIT: 'E', Changeset.MOVE: 'M'}
+
+class RevisionCache:
+    """Copies Store publications into Trac's revision and node_change tables, and reads them back.
+
+    Each sync copies only the publications at or after the timestamp of the newest one copied
+    by the last, which is kept in Trac's system table.  Publications at exactly that second
+    are read again, and skipped if they were copied already.  Syncs happen at most once every
+    refresh_interval seconds, unless they are forced.  On Trac 0.12, the rows belong to the
+    repository called reponame, the default repository unless it is given.
+
+    Copying the whole history can take a long while, so only a forced sync, as made by
+    trac-admin strac sync, fills an empty cache.  Until one has, other syncs copy nothing and
+    synced is false, and the history should be read from Store instead.
+    """
+
+    def __init__(self, env, refresh_interval = 30, reponame = ''):
+        self.env = env
+        self.log = env.log
+        self.refresh_interval = refresh_interval
+        self.reponame = reponame
+        self._repos_id = False
+        self.synced = False
+
+        self._checked = 0
+        self._warned = False
+        self._lock = threading.Lock()
+
+    def sync(self, repository, force = False):
+        """Copy new publications from repository, and return how many there were.
+
+        A sync that fails, as it does when another process has just copied the same
+        publications, is tried once more from the newest publication copied by then.  If that
+        fails too, the error is raised from a forced sync, and otherwise only logged.
+        """
+
+        if not force and time.time() - self._checked < self.refresh_interval:
+            return 0
+
+        self._lock.acquire()
+        try:
+            if not force and time.time() - self._checked < self.refresh_interval:
+                return 0
+            try:
+                copied = self._sync_once(repository, force)
+            except Exception, e:
+                self.log.debug('Syncing the revision cache failed, retrying: %s' % e)
+                try:
+                    copied = self._sync_once(repository, force)
+                except Exception, e:
+                    if force:
+                        raise
+                    self.log.warning('Unable to sync the revision cache: %s' % e)
+                    copied = 0
+            self._checked = time.time()
+            if copied:
+                self.log.info('Copied %i Store publications into the revision cache' % copied)
+            return copied
+        finally:
+            self._lock.release()
+
+    def _sync_once(self, repository, force):
+        db = self.env.get_db_cnx()
+        try:
+            copied = self._sync(db, repository, force)
+            db.commit()
+        except:
+            db.rollback()
+            raise
+        self.synced = copied != None
+        return copied or 0
+
+    def get_changeset(self, rev):
+        """Return the copied StoreChangeset called rev."""
+
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.execute('SELECT rev, time, author, message FROM revision WHERE rev = %s' +
+                       self._in_repository(), (rev,) + self._repository_params())
+        for row in cursor.fetchall():
+            return self._changeset(row)
+        raise NoSuchChangeset(rev)
+
+    def get_changesets(self, start, stop):
+        """Generate the copied StoreChangesets published between start and stop, newest first.
+
+        start and stop are datetimes or, as time.time() returns, seconds since 1970.
+        """
+
+        if isinstance(start, datetime):
+            start = to_timestamp(start)
+        if isinstance(stop, datetime):
+            stop = to_timestamp(stop)
+        if self.repository_id() != None:
+            start, stop = start * 1000000, stop * 1000000
+
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.execute('SELECT rev, time, author, message FROM revision '
+                       'WHERE time >= %s AND time <= %s' + self._in_repository() +
+                       ' ORDER BY time DESC', (long(start), long(stop)) + self._repository_params())
+        for row in cursor.fetchall():
+            yield self._changeset(row)
+
+    def repository_id(self):
+        """Return the id of the repository in Trac 0.12's revision tables, or None on Trac 0.11."""
+
+        if self._repos_id == False:
+            try:
+                from trac.versioncontrol.api import RepositoryManager
+                self._repos_id = RepositoryManager(self.env).get_repository_id(self.reponame)
+            except (ImportError, AttributeError):
+                self._repos_id = None
+        return self._repos_id
+
+    def _in_repository(self):
+        """Return the condition, to append to a WHERE clause, that limits rows to this repository."""
+
+        if self.repository_id() == None:
+            return ''
+        return ' AND repos = %s'
+
+    def _repository_params(self):
+        if self.repository_id() == None:
+            return ()
+        return (self.repository_id(),)
+
+    def _changeset(self, row):
+        rev, timestamp, author, message = row
+        if self.repository_id() != None:
+            timestamp = timestamp / 1000000.0
+        return repos.StoreChangeset(rev, message, author, datetime.fromtimestamp(timestamp, utc))
+
+    def _sync(self, db, repository, force):
+        """Copy the publications that are new since the last sync, using db, and return their number.
+
+        If the cache is empty and force is false, copy nothing and return None.
+        """
+
+        cursor = db.cursor()
+        cursor.execute('SELECT value FROM system WHERE name = %s', (SYNCED_KEY,))
+        row = cursor.fetchone()
+        synced = None
+        if row != None:
+            synced = int(row[0])
+            # trac-admin resync empties the revision table behind our back.
+            if self.repository_id() == None:
+                cursor.execute('SELECT rev FROM revision LIMIT 1')
+            else:
+                cursor.execute('SELECT rev FROM revision WHERE repos = %s LIMIT 1',
+                               self._repository_params())
+            if cursor.fetchone() == None:
+                synced = None
+
+        if synced == None and not force:
+            if not self._warned:
+                self.log.warning('The revision cache is empty, so the timeline is read from Store. '
+                                 'Run trac-admin %s strac sync to fill it.' % self.env.path)
+                self._warned = True
+            return None
+
+        copied = 0
+        newest = synced
+        batch = []
+        for publication in repository.query('publications_since', (synced or 0,), server_side = True):
+            batch.append(publication)
+            if len(batch) >= repository.batch_size:
+                copied += self._copy(cursor, repository, batch, synced)
+                newest = batch[-1][0]
+                batch = []
+        if batch:
+            copied += self._copy(cursor, repository, batch, synced)
+            newest = batch[-1][0]
+
+        if newest != None and newest != synced:
+            if row == None:
+                cursor.execute('INSERT INTO system (name, value) VALUES (%s, %s)',
+                               (SYNCED_KEY, str(newest)))
+            else:
+                cursor.execute('UPDATE system SET value = %s WHERE name = %s',
+                               (str(newest), SYNCED_KEY))
+        return copied
+
+    def _copy(self, cursor, repository, publications, synced):
+        """Insert a batch of rows of the publications_since query, fetching their comments at once."""
+
+        comments = repository.get_blobs([publication[6] for publication in publications])
+        copied = 0
+        for publication in publications:
+            changeset = repos.StoreChangeset.published(publication, comments.get(publication[6], ''))
+            if synced != None and publication[0] <= synced:
+                cursor.execute('SELECT rev FROM revision WHERE rev = %s' + self._in_repository(),
+                               (changeset.rev,) + self._repository_params())
+                if cursor.fetchone() != None:
+                    continue
+
+            timestamp = to_timestamp(changeset.date)
+            if self.repository_id() == None:
+                cursor.execute('INSERT INTO revision (rev, time, author, message) '
+                               'VALUES (%s, %s, %s, %s)',
+                               (changeset.rev, timestamp, changeset.author, changeset.message))
+            else:
+                cursor.execute('INSERT INTO revision (repos, rev, time, author, message) '
+                               'VALUES (%s, %s, %s, %s, %s)',
+                               (self.repository_id(), changeset.rev, long(timestamp) * 1000000,
+                                changeset.author, changeset.message))
+            for path, kind, change, base_path, base_rev in changeset.get_changes():
+                row = (changeset.rev, path, _KINDS[kind], _CHANGES[change], base_path, base_rev)
+                if self.repository_id() == None:
+                    cursor.execute('INSERT INTO node_change (rev, path, node_type, change_type, '
+                                   'base_path, base_rev) VALUES (%s, %s, %s, %s, %s, %s)', row)
+                else:
+                    cursor.execute('INSERT INTO node_change (repos, rev, path, node_type, '
+                                   'change_type, base_path, base_rev) '
+                                   'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                                   (self.repository_id(),) + row)
+            copied += 1
+        return copied
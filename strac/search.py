@@ -0,0 +1,55 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+#
+# Searches the Store repository from Trac's search page, through the search
+# index configured by [strac] search_index.
+
+from trac.core import Component, implements
+from trac.search.api import ISearchSource
+
+from repos import StoreConnector
+from node_util import _store_time
+
+class StoreSearch(Component):
+    """Offers the Store source in the search index to Trac's search page."""
+
+    implements(ISearchSource)
+
+    # ISearchSource methods.
+
+    def get_search_filters(self, req):
+        if StoreConnector(self.env).search_index != None and 'BROWSER_VIEW' in req.perm:
+            yield ('store', 'Store source')
+
+    def get_search_results(self, req, terms, filters):
+        """Generate a result for each class, class extension and namespace that has every word in terms.
+
+        Only the search index is read, after it has been brought up to date.  It must be built
+        with trac-admin's strac index command first.
+        """
+
+        if 'store' not in filters:
+            return
+        connector = StoreConnector(self.env)
+        index = connector.search_index
+        if index == None:
+            return
+        if not index.is_built():
+            self.log.warning('The Store search index has not been built: run trac-admin strac index.')
+            return
+
+        repos = connector.get_repository('store', '', None)
+        try:
+            index.update(repos)
+        finally:
+            repos.close()
+
+        for package, version, entry, timestamp in index.search(terms):
+            name = entry
+            if name.startswith('Root.Smalltalk.'):
+                name = name[len('Root.Smalltalk.'):]
+            yield (req.href.browser('/' + package + '/' + name, rev = version),
+                   '%s in %s %s' % (name, package, version),
+                   _store_time(timestamp), '',
+                   'Published in version %s of %s.' % (version, package))
@@ -0,0 +1,388 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+An on-disk inverted index of the words in the source of a Store repository.
+
+Searching tw_blob directly would decode every blob in the repository for
+every search.  Instead, the words in the latest version of every package are
+kept in an SQLite file within the Trac environment, which is built once in
+bulk and then updated as new versions are published.  The same file cross-
+references selectors to the methods that implement and send them.
+"""
+
+try:
+    import sqlite3
+except ImportError:
+    from pysqlite2 import dbapi2 as sqlite3
+
+import os
+import re
+import threading
+import time
+
+# Words are runs of letters, digits and underscores that don't start with a digit.  Keyword
+# selectors such as at:put: are split into their words, at and put.
+_WORD = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# The number of blobs to fetch at a time while indexing a package.
+_BLOB_BATCH = 500
+
+def _terms(text):
+    """Return the set of lower-cased words in text that are worth indexing."""
+
+    return set([word.lower() for word in _WORD.findall(text) if len(word) > 1])
+
+# The tokens of Smalltalk method source that matter for finding message sends.  Comments are
+# skipped; strings, characters, numbers and symbols are operands; := and _ are assignments,
+# and :name declares a block argument.
+_TOKEN = re.compile(r"""
+      (?P<comment>"[^"]*")
+    | (?P<literal>'(?:[^']|'')*'|\$.|\d+(?:r[0-9A-Z]+)?(?:\.\d+)?(?:e-?\d+)?)
+    | (?P<symbol>\#(?:[A-Za-z_][A-Za-z0-9_]*:)+|\#[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<assignment>:=|_(?![A-Za-z0-9_]))
+    | (?P<argument>:[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<keyword>[A-Za-z_][A-Za-z0-9_]*:(?!=))
+    | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)
+    | (?P<open>\#?[(\[{])
+    | (?P<close>[)\]}])
+    | (?P<cascade>;)
+    | (?P<statement>[.^!])
+    | (?P<binary>[-+*/\\<>=~@%|&?,]+)
+    """, re.VERBOSE)
+
+def _sent_selectors(source):
+    """Return the set of selectors that the method whose source is given sends.
+
+    The first line of the source, which declares the method's own selector and arguments, is
+    skipped.  The rest is scanned once, without parsing: an identifier that follows an operand
+    is a unary send, consecutive keywords at the same level of parentheses and brackets make up
+    one keyword selector, and literal symbols count as sends, since they are usually performed.
+    Temporary variable and block argument declarations, and pragmas such as <primitive: 60>,
+    are skipped.  Binary selectors are not recorded.
+    """
+
+    sends = set()
+    newline = source.find('\n')
+    if newline < 0:
+        return sends
+
+    keywords = [[]]
+    after_operand = False
+    arguments = False
+    # While skipping a declaration or pragma, the binary token that ends it.
+    skip_until = None
+    for match in _TOKEN.finditer(source, newline):
+        kind = match.lastgroup
+        token = match.group()
+        if kind == 'comment':
+            continue
+        elif skip_until != None:
+            if kind == 'binary' and token.endswith(skip_until):
+                skip_until = None
+        elif kind == 'binary' and not after_operand and token in ('|', '||', '<'):
+            # | opens temporaries, || closes block arguments and opens temporaries, and <
+            # opens a pragma, wherever no operand precedes them.
+            if token == '<':
+                skip_until = '>'
+            elif token == '|' and arguments:
+                arguments = False
+            else:
+                skip_until = '|'
+        elif kind == 'argument':
+            arguments = True
+        elif kind == 'identifier':
+            if after_operand:
+                sends.add(token)
+            after_operand = True
+        elif kind == 'keyword':
+            keywords[-1].append(token)
+            after_operand = False
+        elif kind == 'symbol':
+            sends.add(token[1:])
+            after_operand = True
+        elif kind == 'literal':
+            after_operand = True
+        elif kind == 'open':
+            keywords.append([])
+            after_operand = False
+        elif kind == 'close':
+            if keywords[-1]:
+                sends.add(''.join(keywords[-1]))
+            if len(keywords) > 1:
+                keywords.pop()
+            else:
+                keywords[-1] = []
+            after_operand = True
+        elif kind == 'cascade' or kind == 'statement':
+            if keywords[-1]:
+                sends.add(''.join(keywords[-1]))
+                keywords[-1] = []
+            # The messages of a cascade go to the receiver of the one before.
+            after_operand = kind == 'cascade'
+        else:
+            after_operand = False
+        if kind != 'argument':
+            arguments = False
+    for parts in keywords:
+        if parts:
+            sends.add(''.join(parts))
+    return sends
+
+def _method_of(label):
+    """Return the class name and selector of the method that a package_parts label names, or None."""
+
+    classname, separator, rest = label.partition('>>')
+    if not separator:
+        return None
+    return classname, rest.rsplit(' {', 1)[0]
+
+class SearchIndex:
+    """An inverted index of the words in the latest version of every package, in an SQLite file.
+
+    Each class, class extension and namespace in an indexed package version is a document,
+    and the index maps each word in its methods, definition, comment and shared variables,
+    and in its name, to the documents that contain it.  Indexing a newer version of a
+    package replaces the documents of the version indexed before.
+
+    The index also maps each selector to the methods that implement it and to those that send
+    it, as found by _sent_selectors().  Selectors are stored once each and referred to by
+    number, and every cross-reference is keyed by its selector, so finding the implementors or
+    senders of a selector is a single indexed read.
+
+    The primary key of the newest package version indexed so far is kept in the file, so
+    that each update only indexes the versions published since.  Updates happen at most once
+    every refresh_interval seconds, unless they are forced.
+    """
+
+    def __init__(self, path, log = None, refresh_interval = 30):
+        self.path = path
+        self.log = log
+        self.refresh_interval = refresh_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._checked = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def is_built(self):
+        """Answer whether the index has been built, so that it only needs to be kept up to date."""
+
+        return self._newest_package() != None
+
+    def search(self, terms):
+        """Return (package, version, entry, timestamp) tuples for each document that has every word in terms."""
+
+        words = set()
+        for term in terms:
+            words |= _terms(term)
+        if not words:
+            return []
+
+        postings = ' INTERSECT '.join(['SELECT document FROM postings WHERE term = ?'] * len(words))
+        return self._connection().execute(
+            'SELECT package, version, entry, timestamp FROM documents WHERE id IN (%s) '
+            'ORDER BY package, entry' % postings, list(words)).fetchall()
+
+    def implementors(self, selector):
+        """Return (package, version, entry, class_side) tuples for each method called selector.
+
+        class_side is true for methods of the class rather than of its instances.
+        """
+
+        return self._connection().execute(
+            'SELECT d.package, d.version, d.entry, i.class_side FROM implementors i, documents d '
+            'WHERE i.selector = (SELECT id FROM selectors WHERE name = ?) AND d.id = i.document '
+            'ORDER BY d.package, d.entry, i.class_side', (selector,)).fetchall()
+
+    def senders(self, selector):
+        """Return (package, version, entry, class_side, method) tuples for each method that sends selector.
+
+        method is the selector of the sending method.
+        """
+
+        return self._connection().execute(
+            'SELECT d.package, d.version, d.entry, s.class_side, m.name '
+            'FROM senders s, documents d, selectors m '
+            'WHERE s.selector = (SELECT id FROM selectors WHERE name = ?) '
+            'AND d.id = s.document AND m.id = s.method '
+            'ORDER BY d.package, d.entry, s.class_side, m.name', (selector,)).fetchall()
+
+    def update(self, repos, force = False):
+        """Index the package versions published since the last update, and return how many there were.
+
+        The first update indexes the latest version of every package in repos.
+        """
+
+        if not force and time.time() - self._checked < self.refresh_interval:
+            return 0
+
+        self._lock.acquire()
+        try:
+            newest = self._newest_package()
+            if newest == None:
+                rows = repos.query('latest_packages', server_side = True)
+            else:
+                rows = repos.query('packages_since', (newest,))
+            packages = [(row[0], row[1], row[2], row[3]) for row in rows]
+            packages.sort()
+
+            for primarykey, name, version, timestamp in packages:
+                self._index_package(repos, primarykey, name, version, timestamp)
+            self._checked = time.time()
+            return len(packages)
+        finally:
+            self._lock.release()
+
+    def _index_package(self, repos, primarykey, name, version, timestamp):
+        """Replace the documents of package name with those of the version with primary key primarykey."""
+
+        connection = self._connection()
+        row = connection.execute('SELECT MAX(timestamp) FROM documents WHERE package = ?',
+                                 (name,)).fetchone()
+        if row[0] != None and row[0] > timestamp:
+            # A newer version is indexed already.
+            self._set_newest_package(connection, primarykey)
+            connection.commit()
+            return
+
+        entries = {}
+        methods = {}
+        for part in repos.query('package_parts', (primarykey,), server_side = True):
+            entry, label, blob_id = part[0], part[1], part[2]
+            entries.setdefault(entry, set())
+            if blob_id:
+                entries[entry].add(blob_id)
+            method = _method_of(label)
+            if method != None:
+                classname, selector = method
+                methods.setdefault(entry, []).append(
+                    (selector, classname.endswith(' class'), blob_id))
+
+        # Each blob is decoded and split into words once, however many entries share it.
+        blob_terms = {}
+        blob_sends = {}
+        blob_ids = set()
+        for ids in entries.values():
+            blob_ids |= ids
+        blob_ids = list(blob_ids)
+        for start in range(0, len(blob_ids), _BLOB_BATCH):
+            for blob_id, text in repos.fetch_blobs(blob_ids[start:start + _BLOB_BATCH]).iteritems():
+                blob_terms[blob_id] = _terms(text)
+                blob_sends[blob_id] = _sent_selectors(text)
+
+        selector_ids = {}
+        try:
+            for table in ('postings', 'implementors', 'senders'):
+                connection.execute('DELETE FROM %s WHERE document IN '
+                                   '(SELECT id FROM documents WHERE package = ?)' % table, (name,))
+            connection.execute('DELETE FROM documents WHERE package = ?', (name,))
+            for entry, blob_ids in entries.items():
+                document = connection.execute(
+                    'INSERT INTO documents (packageref, package, version, entry, timestamp) '
+                    'VALUES (?, ?, ?, ?, ?)', (primarykey, name, version, entry, timestamp)).lastrowid
+                words = _terms(entry)
+                for blob_id in blob_ids:
+                    words |= blob_terms.get(blob_id, set())
+                connection.executemany('INSERT INTO postings (term, document) VALUES (?, ?)',
+                                       [(word, document) for word in words])
+
+                implementors = set()
+                senders = set()
+                for selector, class_side, blob_id in methods.get(entry, []):
+                    method = self._selector_id(connection, selector, selector_ids)
+                    implementors.add((method, document, class_side))
+                    for sent in blob_sends.get(blob_id, ()):
+                        senders.add((self._selector_id(connection, sent, selector_ids),
+                                     document, class_side, method))
+                connection.executemany('INSERT INTO implementors (selector, document, class_side) '
+                                       'VALUES (?, ?, ?)', list(implementors))
+                connection.executemany('INSERT INTO senders (selector, document, class_side, method) '
+                                       'VALUES (?, ?, ?, ?)', list(senders))
+            self._set_newest_package(connection, primarykey)
+            connection.commit()
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+
+    def _selector_id(self, connection, selector, ids):
+        """Return the number of selector in the selectors table, adding it if necessary.
+
+        ids caches the numbers that have been looked up already.
+        """
+
+        id = ids.get(selector)
+        if id == None:
+            connection.execute('INSERT OR IGNORE INTO selectors (name) VALUES (?)', (selector,))
+            id = connection.execute('SELECT id FROM selectors WHERE name = ?',
+                                    (selector,)).fetchone()[0]
+            ids[selector] = id
+        return id
+
+    def _newest_package(self):
+        row = self._connection().execute(
+            "SELECT value FROM state WHERE name = 'newest_package'").fetchone()
+        if row == None:
+            return None
+        return int(row[0])
+
+    def _set_newest_package(self, connection, primarykey):
+        connection.execute("INSERT OR REPLACE INTO state (name, value) VALUES ('newest_package', ?)",
+                           (str(primarykey),))
+
+    def _connection(self):
+        """Return this thread's connection to the index file, creating the file if necessary."""
+
+        connection = getattr(self._local, 'connection', None)
+        if connection == None:
+            connection = sqlite3.connect(self.path, timeout = 10)
+            connection.text_factory = str
+            try:
+                connection.execute('PRAGMA journal_mode = WAL')
+            except sqlite3.Error:
+                pass
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    packageref INTEGER NOT NULL,
+                    package TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    entry TEXT NOT NULL,
+                    timestamp INTEGER NOT NULL)
+                """)
+            connection.execute('CREATE INDEX IF NOT EXISTS documents_package ON documents (package)')
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    document INTEGER NOT NULL,
+                    PRIMARY KEY (term, document))
+                """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS selectors (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE)
+                """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS implementors (
+                    selector INTEGER NOT NULL,
+                    document INTEGER NOT NULL,
+                    class_side INTEGER NOT NULL,
+                    PRIMARY KEY (selector, document, class_side))
+                """)
+            connection.execute('CREATE INDEX IF NOT EXISTS implementors_document ON implementors (document)')
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS senders (
+                    selector INTEGER NOT NULL,
+                    document INTEGER NOT NULL,
+                    class_side INTEGER NOT NULL,
+                    method INTEGER NOT NULL,
+                    PRIMARY KEY (selector, document, class_side, method))
+                """)
+            connection.execute('CREATE INDEX IF NOT EXISTS senders_document ON senders (document)')
+            connection.execute('CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT)')
+            connection.commit()
+            self._local.connection = connection
+        return connection
@@ -4,7 +4,7 @@
 
 from trac.versioncontrol.api import Node
 
-import repos
+from node_util import ContentStream
 
 class StoreNode(Node):
     """A single node in a Store repository virtual tree.
@@ -12,9 +12,14 @@ class StoreNode(Node):
     In Store, a node can be either a virtual root node, a bundle, a package, or a class.
     """
 
+    # The primary keys in tw_blob of the definition and comment of a class or namespace.
+    definition_id = None
+    comment_id = 0
+
     def __init__(self, path, rev, kind, repos):
         Node.__init__(self, path, rev, kind)
         self.repos = repos
+        self.rendered = None
 
     def get_content(self):
         return None
@@ -23,12 +28,68 @@ class StoreNode(Node):
         return None
 
     def get_history(self, limit = None):
-        # Temporary stub for 'previous revision'
-        self.repos.log.debug('path = <%s> rev = <%s>' % (self.path, self.rev))
-        return [(self.path, self.rev, repos.StoreChangeset.EDIT)]
+        """Generate the (path, rev, change) tuples of the versions that changed this node, newest first."""
+
+        return self.repos.get_path_history(self.path, self.rev, limit)
 
     def get_annotations(self):
-        pass
+        """Return a list of the changeset rev that introduced each line of this node's content.
+
+        Each method, definition, comment and shared variable is blamed on the oldest version of
+        the owning package that included its blob, and the headers between them on the oldest
+        version that included this node.  The list is kept in the repository's annotation cache,
+        keyed like the rendered content.
+        """
+
+        if self.kind == StoreNode.DIRECTORY:
+            return None
+
+        caches = self.repos.caches
+        key = (self.owning_package.id, StoreNode.get_name(self))
+        annotations = caches.annotations.get(key)
+        if annotations == None:
+            annotations = self._annotate()
+            caches.annotations.put(key, annotations)
+        return annotations
+
+    def _annotate(self):
+        content = self.get_content().read()
+        package = self.owning_package.get_name()
+        origins = self.repos.get_entry_origins(package, StoreNode.get_name(self), self.rev)
+        default = package + '@' + origins.get(None, self.rev)
+        annotations = [default] * len(content.splitlines())
+
+        # This node may have been built from the content cache, without knowing its parts.
+        node = self.owning_package.subnode_named(StoreNode.get_name(self))
+        if node == None:
+            return annotations
+        line = scanned = 0
+        for blob_id, text in node._rendered_parts():
+            start = content.find(text, scanned)
+            if start < 0 or blob_id not in origins:
+                continue
+            line += content.count('\n', scanned, start)
+            span = text.rstrip('\n').count('\n') + 1
+            annotations[line:line + span] = [package + '@' + origins[blob_id]] * span
+            line += text.count('\n')
+            scanned = start + len(text)
+        return annotations[:len(content.splitlines())]
+
+    def _rendered_parts(self):
+        """Return (blob id, text) pairs for the parts of this node, in the order they are rendered."""
+
+        parts = []
+        if self.definition_id != None and self.definition:
+            parts.append((self.definition_id, self.definition.strip()))
+        if self.comment_id and self.comment:
+            parts.append((self.comment_id, self.comment.strip()))
+        for protocols in self._protocol_sections():
+            for protocol in sorted(protocols):
+                for method in sorted(protocol.get_methods()):
+                    parts.append((method.source_id, self._method_fragment(method)))
+        for svar in sorted(self.shared_vars):
+            parts.append((svar.definition_id, svar.get_definition()))
+        return [(blob_id, text) for blob_id, text in parts if text]
 
     def get_properties(self):
         return {}
@@ -50,49 +111,161 @@ class StoreNode(Node):
         else:
             return name
 
-    def _write_protocols(self, stream, header, protocols):
-        """Format methods and protocols properly to stream, in good wiki format.
+    def _cached_content(self, render):
+        """Return a stream over the rendered content of this class, class extension or namespace.
+
+        render is a generator function that produces the content in chunks.  Rendered content
+        is kept in the repository's content cache and render store, keyed by the primary key of
+        the owning package version and this node's name: published versions never change.
+
+        Consecutive versions of a package mostly contain the same blobs, so rendered content is
+        also kept in the fragment cache, keyed by the node's signature of names and blob ids.  A
+        node whose signature is unchanged from an earlier version reuses its rendered content
+        without fetching any source.  Otherwise, only the source of the methods that have not been
+        rendered before is fetched.
+
+        A node with more methods than the repository's stream_threshold is not cached as a whole.
+        Its content is rendered as it is read, protocol by protocol, and the source of each
+        protocol's methods is fetched only when the protocol is reached.
+        """
+
+        if self.rendered != None:
+            return ContentStream([self.rendered])
+
+        caches = self.repos.caches
+        key = (self.owning_package.id, StoreNode.get_name(self))
+        entry = caches.get_rendered(key)
+        if entry == None:
+            page_key = ('page', self.entry_kind, self._signature())
+            rendered = caches.fragments.get(page_key)
+            if rendered == None:
+                if len(self._get_methods()) > self.repos.stream_threshold:
+                    self.load_sources(True, False)
+                    return ContentStream(render())
+                self.load_sources(True)
+                rendered = ''.join(render())
+                caches.fragments.put(page_key, rendered)
+            entry = (self.entry_kind, rendered)
+            caches.put_rendered(key, entry)
+        self.rendered = entry[1]
+        return ContentStream([self.rendered])
+
+    def load_sources(self, for_rendering = False, with_methods = True):
+        """Fetch the text of this node's definition, comment, method source and shared variables.
 
-        If protocols is nonempty, prefix it with header.
+        Everything is fetched in a single batch, and only if it isn't in the blob cache already.
+        If for_rendering is true, the source of methods whose rendered form is in the fragment
+        cache is not fetched at all.  If with_methods is false, no method source is fetched: it
+        is left to _format_protocols() to fetch as it renders.
+        """
+
+        methods = []
+        if with_methods:
+            methods = self._get_methods()
+        if for_rendering:
+            fragments = self.repos.caches.fragments
+            methods = [m for m in methods if ('method', m.source_id) not in fragments]
+
+        ids = [self.definition_id, self.comment_id] + [m.source_id for m in methods] + \
+            [svar.definition_id for svar in self.shared_vars]
+        blobs = self.repos.get_blobs(ids)
+
+        for method in methods:
+            method.set_source(blobs.get(method.source_id))
+        for svar in self.shared_vars:
+            svar.set_definition(blobs.get(svar.definition_id, ''))
+        if self.definition_id != None:
+            self.definition = blobs.get(self.definition_id, '')
+        if self.comment_id:
+            self.comment = blobs.get(self.comment_id, '')
+
+    def _get_methods(self):
+        """Return every Method of this node, on both the instance and class sides."""
+
+        return []
+
+    def _protocol_sections(self):
+        """Return the lists of protocols of this node, in the order they are rendered."""
+
+        return []
+
+    def _signature(self):
+        """Return a tuple that identifies this node's rendered content across package versions."""
+
+        return (StoreNode.get_name(self), self.definition_id, self.comment_id,
+                tuple(sorted([(svar.name, svar.definition_id) for svar in self.shared_vars])))
+
+    def _protocols_signature(self, protocols):
+        """Return a tuple of the protocol, name and source id of every method in protocols."""
+
+        return tuple(sorted([(protocol.name, method.name, method.source_id)
+                             for protocol in protocols for method in protocol.get_methods()]))
+
+    def _method_fragment(self, method):
+        """Return the rendered form of method, from the fragment cache if possible."""
+
+        fragments = self.repos.caches.fragments
+        key = ('method', method.source_id)
+        fragment = fragments.get(key)
+        if fragment == None:
+            source = method.source
+            if source == None:
+                # The fragment was evicted after load_sources() decided not to fetch it.
+                source = self.repos.get_blobs([method.source_id]).get(method.source_id, '')
+            fragment = "{{{\n" + source.strip() + "\n}}}\n"
+            fragments.put(key, fragment)
+        return fragment
+
+    def _format_protocols(self, header, protocols):
+        """Generate methods and protocols properly formatted in good wiki format, a protocol at a time.
+
+        If protocols is nonempty, prefix it with header.  The source of any of a protocol's
+        methods that is needed but not loaded is fetched in one batch when the protocol is
+        reached, and let go of once it has been rendered.
         """
 
         if len(protocols) != 0:
-            stream.write(header)
-            stream.write("\n")
+            yield header + "\n"
 
+        fragments = self.repos.caches.fragments
         for protocol in sorted(protocols):
-            stream.write("\n''")
-            stream.write(str(protocol))
-            stream.write("''\n\n")
-            
-            for method in sorted(protocol.get_methods()):
-                stream.write("{{{\n")
-                stream.write(method.source.strip())
-                stream.write("\n}}}\n")
-
-    def _write_comment(self, stream, header, comment_text):
-        """Format a class or namespace comment properly to stream, in good wiki format.
+            methods = sorted(protocol.get_methods())
+            missing = [m for m in methods
+                       if m.source == None and ('method', m.source_id) not in fragments]
+            if missing:
+                blobs = self.repos.get_blobs([m.source_id for m in missing])
+                for method in missing:
+                    method.set_source(blobs.get(method.source_id))
+
+            chunk = ["\n''", str(protocol), "''\n\n"]
+            for method in methods:
+                chunk.append(self._method_fragment(method))
+            for method in missing:
+                method.set_source(None)
+            yield ''.join(chunk)
+
+    def _format_comment(self, header, comment_text):
+        """Return a class or namespace comment properly formatted in good wiki format.
 
         If comment is nonempty, prefix it with header.
         """
 
-        if comment_text != '':
-            stream.write(header)
-            stream.write("\n\n")
-            stream.write(comment_text.strip())
-            stream.write("\n\n")
+        if comment_text == '':
+            return ''
+        return header + "\n\n" + comment_text.strip() + "\n\n"
 
-    def _write_shared_vars(self, stream, header, shared_vars):
-        """Display the definition of each shared variable in shared_vars.
+    def _format_shared_vars(self, header, shared_vars):
+        """Return the definition of each shared variable in shared_vars.
 
         The shared_vars is nonempty, prefix it with header.
         """
 
-        if len(shared_vars) != 0:
-            stream.write(header)
-            stream.write("\n\n")
+        if len(shared_vars) == 0:
+            return ''
 
+        chunk = [header, "\n\n"]
         for shared_var in sorted(shared_vars):
-            stream.write("{{{\n")
-            stream.write(shared_var.get_definition())
-            stream.write("\n}}}\n")
+            chunk.append("{{{\n")
+            chunk.append(shared_var.get_definition())
+            chunk.append("\n}}}\n")
+        return ''.join(chunk)
@@ -0,0 +1,95 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+"""
+A minimal pool of worker threads.
+"""
+
+import Queue
+import sys
+import threading
+
+class Job:
+    """A function call submitted to a WorkerPool, and eventually its outcome.
+
+    A job runs at most once, in whichever thread claims it first.
+    """
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._claimed = False
+        self._claim_lock = threading.Lock()
+
+    def claim(self):
+        """Answer whether the calling thread is the first to claim the job, and so should run it."""
+
+        self._claim_lock.acquire()
+        try:
+            if self._claimed:
+                return False
+            self._claimed = True
+            return True
+        finally:
+            self._claim_lock.release()
+
+    def run(self):
+        try:
+            self._result = self.function(*self.args)
+        except:
+            self._error = sys.exc_info()
+        self._done.set()
+
+    def result(self):
+        """Wait for the job to finish, then return its result or raise its exception."""
+
+        self._done.wait()
+        if self._error != None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+class DeferredJob(Job):
+    """A Job that isn't submitted anywhere, but runs in the first thread to ask for its result."""
+
+    def result(self):
+        if self.claim():
+            self.run()
+        return Job.result(self)
+
+class WorkerPool:
+    """A fixed number of daemon threads that run submitted jobs in order.
+
+    Each worker thread checks database connections out of a ConnectionPool for
+    itself, so jobs that create their own StoreRepository run in parallel on
+    separate connections.
+    """
+
+    def __init__(self, size, name = 'strac-worker'):
+        self.size = max(size, 1)
+        self._queue = Queue.Queue()
+        for i in range(self.size):
+            thread = threading.Thread(target = self._work, name = '%s-%i' % (name, i))
+            thread.setDaemon(True)
+            thread.start()
+
+    def submit(self, function, *args):
+        """Queue a call to function with args, and return its Job."""
+
+        job = Job(function, args)
+        self._queue.put(job)
+        return job
+
+    def pending(self):
+        """Return the approximate number of jobs that have not yet started."""
+
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job.claim():
+                job.run()
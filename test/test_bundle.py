@@ -31,3 +31,12 @@ class TestBundle(StoreTestCase):
         for node in children:
             if node.get_name()[:-1] != 'TestPackage':
                 self.fail('TestBundle reported a child called ' + node.get_name())
+
+    def test_tree(self):
+        """A bundle's tree should be loaded once and then served from the cache."""
+
+        tree = self.node.get_tree()
+        self.assertEquals(
+            ['TestPackage1', 'TestPackage2'],
+            sorted([name for kind, id, name, version in tree[self.node.id]]))
+        self.assertTrue(tree is self.node.get_tree())
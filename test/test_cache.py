@@ -0,0 +1,53 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from strac.cache import LRUCache
+
+import unittest
+
+class TestLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LRUCache(2)
+
+    def test_get_and_put(self):
+        """Values stored in the cache should be returned by get()."""
+
+        self.cache.put('one', 1)
+        self.assertEquals(1, self.cache.get('one'))
+        self.assertEquals(None, self.cache.get('two'))
+        self.assertEquals((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_eviction(self):
+        """The least recently used entry should be evicted when the cache is full."""
+
+        self.cache.put('one', 1)
+        self.cache.put('two', 2)
+        self.cache.get('one')
+        self.cache.put('three', 3)
+        self.assertTrue('one' in self.cache)
+        self.assertFalse('two' in self.cache)
+        self.assertTrue('three' in self.cache)
+        self.assertEquals(2, len(self.cache))
+
+    def test_replace(self):
+        """Storing a value under an existing key should replace it."""
+
+        self.cache.put('one', 1)
+        self.cache.put('one', 'uno')
+        self.assertEquals('uno', self.cache.get('one'))
+        self.assertEquals(1, len(self.cache))
+
+    def test_byte_budget(self):
+        """A cache with a byte budget should evict entries to stay within it."""
+
+        cache = LRUCache(max_bytes = 10)
+        cache.put(1, 'abcd')
+        cache.put(2, 'efgh')
+        cache.put(3, 'ijkl')
+        self.assertFalse(1 in cache)
+        self.assertEquals(8, cache.bytes)
+
+        cache.put(2, 'e')
+        self.assertEquals(5, cache.bytes)
@@ -0,0 +1,110 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from strac.catalog import LatestVersions, NameCatalog, VersionIndex
+
+import unittest
+
+class FakeRepository:
+    """Answers the queries used by LatestVersions from a list of publications."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, name, params = (), server_side = False):
+        self.queries.append(name)
+        if name.startswith('latest_'):
+            return list(self.rows)
+        return [row for row in self.rows if row[0] > params[0]]
+
+class TestLatestVersions(unittest.TestCase):
+
+    def setUp(self):
+        self.repos = FakeRepository([(1, 'TestPackage1', '1.0', 100), (2, 'TestPackage2', '1.0', 110)])
+        self.latest = LatestVersions('latest_packages', 'packages_since', 30)
+
+    def test_lookup(self):
+        """Lookups should be answered from a single query."""
+
+        self.assertEquals((1, '1.0'), self.latest.lookup(self.repos, 'TestPackage1'))
+        self.assertEquals((2, '1.0'), self.latest.lookup(self.repos, 'TestPackage2'))
+        self.assertEquals(None, self.latest.lookup(self.repos, 'Baaaaarf'))
+        self.assertEquals(['latest_packages'], self.repos.queries)
+
+    def test_refresh(self):
+        """Refreshing should only ask for versions newer than those already seen."""
+
+        self.latest.lookup(self.repos, 'TestPackage1')
+        self.repos.rows.append((3, 'TestPackage1', '1.1', 120))
+        self.assertEquals((1, '1.0'), self.latest.lookup(self.repos, 'TestPackage1'))
+
+        self.latest.invalidate()
+        self.assertEquals((3, '1.1'), self.latest.lookup(self.repos, 'TestPackage1'))
+        self.assertEquals(['latest_packages', 'packages_since'], self.repos.queries)
+
+    def test_failed_load(self):
+        """A load that fails partway should be retried in full."""
+
+        def failing(name, params = (), server_side = False):
+            yield (2, 'TestPackage2', '1.0', 110)
+            raise IOError('connection lost')
+        query = self.repos.query
+        self.repos.query = failing
+        self.assertRaises(IOError, self.latest.lookup, self.repos, 'TestPackage1')
+
+        self.repos.query = query
+        self.assertEquals((1, '1.0'), self.latest.lookup(self.repos, 'TestPackage1'))
+        self.assertEquals(['latest_packages'], self.repos.queries)
+
+class TestNameCatalog(unittest.TestCase):
+
+    def test_kinds_of(self):
+        """Names should be classified as bundles, packages or both."""
+
+        bundles = FakeRepository([(1, 'TestBundle', '1.0', 100), (2, 'Shared', '1.0', 100)])
+        packages = FakeRepository([(1, 'TestPackage1', '1.0', 100), (2, 'Shared', '1.0', 100)])
+        latest_bundles = LatestVersions('latest_bundles', 'bundles_since', 30)
+        latest_packages = LatestVersions('latest_packages', 'packages_since', 30)
+        latest_bundles.refresh(bundles)
+        latest_packages.refresh(packages)
+
+        catalog = NameCatalog(latest_bundles, latest_packages)
+        self.assertEquals([NameCatalog.BUNDLE], catalog.kinds_of(None, 'TestBundle'))
+        self.assertEquals([NameCatalog.PACKAGE], catalog.kinds_of(None, 'TestPackage1'))
+        self.assertEquals([NameCatalog.BUNDLE, NameCatalog.PACKAGE], catalog.kinds_of(None, 'Shared'))
+        self.assertEquals([], catalog.kinds_of(None, 'Baaaaarf'))
+
+class TestVersionIndex(unittest.TestCase):
+
+    def setUp(self):
+        # (primarykey, version, timestamp), out of order, with two versions in the same second.
+        self.index = VersionIndex([(3, '1.2', 120), (1, '1.0', 100), (4, '1.3', 120), (2, '1.1', 110)])
+
+    def test_order(self):
+        """Versions should be ordered by timestamp, then by primary key."""
+
+        self.assertEquals(['1.0', '1.1', '1.2', '1.3'], self.index.versions)
+        self.assertEquals('1.0', self.index.oldest())
+        self.assertEquals('1.3', self.index.youngest())
+        self.assertTrue(self.index.older_than('1.2', '1.3'))
+        self.assertFalse(self.index.older_than('1.3', '1.2'))
+        self.assertFalse(self.index.older_than('1.3', '9.9'))
+
+    def test_neighbours(self):
+        """Each version should know the ones published just before and after it."""
+
+        self.assertEquals(None, self.index.previous('1.0'))
+        self.assertEquals('1.0', self.index.previous('1.1'))
+        self.assertEquals('1.3', self.index.next('1.2'))
+        self.assertEquals(None, self.index.next('1.3'))
+        self.assertEquals(None, self.index.next('9.9'))
+
+    def test_version_at(self):
+        """The version current at a time should be the last published at or before it."""
+
+        self.assertEquals(None, self.index.version_at(99))
+        self.assertEquals('1.0', self.index.version_at(100))
+        self.assertEquals('1.1', self.index.version_at(119))
+        self.assertEquals('1.3', self.index.version_at(500))
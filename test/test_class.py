@@ -6,9 +6,12 @@ from test.strac_test import StoreTestCase
 
 from strac.packagenode import PackageNode
 from strac.classnode import ClassNode
+from strac.repos import StoreChangeset, StoreRepository
+from strac.cache import StoreCaches
 from strac.node_util import Method, Protocol
 
 import difflib
+import unittest
 
 class TestClass(StoreTestCase):
 
@@ -204,3 +207,98 @@ new
         """get_content() should return a stream object that is available for reading."""
 
         self.assertNotEquals('', self.node.get_content().read(10))
+
+    def test_content_cache(self):
+        """Rendered content should be cached by package version and class name."""
+
+        content = self.node.get_content().getvalue()
+        cached = self.pkg_node.rendered_subnode_named('StracTest.StracClass11')
+        self.assertEquals(ClassNode, cached.__class__)
+        self.assertEquals(self.node.path, cached.path)
+        self.assertEquals(content, cached.get_content().getvalue())
+
+    def test_content_streaming(self):
+        """Classes with more methods than the stream threshold should render as they are read."""
+
+        content = self.node.get_content().getvalue()
+        self.repos.caches.content.clear()
+        self.repos.caches.fragments.clear()
+        self.repos.stream_threshold = 0
+        streamed = self.pkg_node.subnode_named('StracTest.StracClass11').get_content()
+        self.assertEquals(content[:10], streamed.read(10))
+        self.assertEquals(content[10:], streamed.read())
+        self.assertEquals('', streamed.read(10))
+
+    def test_history(self):
+        """A class should be added by the first version of its package that contains it."""
+
+        self.assertEquals([('/TestPackage1/StracTest.StracClass11', 'TestPackage1@1.0',
+                            StoreChangeset.ADD)],
+                          list(self.node.get_history()))
+        self.assertEquals(1, len(list(self.node.get_history(1))))
+
+    def test_annotations(self):
+        """Every line of a class should be blamed on the package version that introduced it."""
+
+        annotations = self.node.get_annotations()
+        self.assertEquals(len(self.node.get_content().read().splitlines()), len(annotations))
+        self.assertEquals(['TestPackage1@1.0'], list(set(annotations)))
+        self.assert_(self.node.get_annotations() is annotations)
+
+class TwoVersionRepository(StoreRepository):
+    """A repository, without a database, in which version 1.1 of TestPackage changes one
+    method of Foo from version 1.0."""
+
+    BLOBS = {1: 'Object subclass: #Foo', 10: 'foo\n\t^1', 11: 'bar\n\t^2', 12: 'bar\n\t^3'}
+    METHODS = {1: [('Root.Smalltalk.Foo', 'foo', 'accessing', 10),
+                   ('Root.Smalltalk.Foo', 'bar', 'accessing', 11)],
+               2: [('Root.Smalltalk.Foo', 'foo', 'accessing', 10),
+                   ('Root.Smalltalk.Foo', 'bar', 'accessing', 12)]}
+
+    def __init__(self):
+        self.caches = StoreCaches()
+        self.stream_threshold = 1000
+        self.server_side_decoding = False
+        self.query_pool = None
+        self.prefetcher = None
+
+    def query(self, name, params = (), server_side = False):
+        if name == 'latest_packages':
+            return [(2, 'TestPackage', '1.1', 110)]
+        if name == 'package_versions':
+            return [(1, '1.0', 100), (2, '1.1', 110)]
+        if name == 'package_manifest':
+            return [('C', 'Root.Smalltalk.Foo')]
+        if name == 'class_definition':
+            return [(100, 0, 1)]
+        if name == 'methods_of_class':
+            return self.METHODS[params[0]]
+        if name == 'entry_history':
+            rows = []
+            for packageref, methods in self.METHODS.items():
+                rows.append((packageref, 'definition', 1))
+                for classname, selector, protocol, blob_id in methods:
+                    rows.append((packageref, classname + ' ' + protocol + ' ' + selector, blob_id))
+            return rows
+        return []
+
+    def fetch_blobs(self, ids):
+        return dict([(id, self.BLOBS[id]) for id in ids if id in self.BLOBS])
+
+class TestAnnotations(unittest.TestCase):
+
+    def test_annotations(self):
+        """Each method should be blamed on the version that introduced its source, even when the
+        class's content is already cached."""
+
+        repos = TwoVersionRepository()
+        package = PackageNode('/TestPackage', '1.1', repos, 2)
+        content = package.subnode_named('Foo').get_content().read()
+        node = package.rendered_subnode_named('Foo')
+        self.assertEquals(None, node.definition_id)
+
+        blame = dict(zip(content.splitlines(), node.get_annotations()))
+        self.assertEquals('TestPackage@1.0', blame['Object subclass: #Foo'])
+        self.assertEquals('TestPackage@1.0', blame['\t^1'])
+        self.assertEquals('TestPackage@1.1', blame['\t^3'])
+        self.assertEquals('TestPackage@1.1', blame['bar'])
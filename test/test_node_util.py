@@ -0,0 +1,47 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from strac.node_util import _strac_decode, _strac_decode_rows, ContentStream
+
+from base64 import b64encode
+
+import unittest
+
+class TestDecoding(unittest.TestCase):
+
+    def test_decode(self):
+        """Blobs should be decoded from base64, with Smalltalk line ends converted."""
+
+        self.assertEquals("foo\n\t^1", _strac_decode(b64encode("foo\r\t^1")))
+
+    def test_decode_rows(self):
+        """Rows of blobs should be decoded into a dictionary by primary key."""
+
+        rows = [(1, b64encode("foo\r\t^1")), (2, b64encode("bar")), (3, '')]
+        self.assertEquals({1: "foo\n\t^1", 2: "bar", 3: ""}, _strac_decode_rows(rows))
+
+    def test_decoded_on_server(self):
+        """Rows that the database has decoded should be collected as they are."""
+
+        rows = [(1, "foo\n\t^1"), (2, "bar")]
+        self.assertEquals({1: "foo\n\t^1", 2: "bar"}, _strac_decode_rows(rows, True))
+
+class TestContentStream(unittest.TestCase):
+
+    def test_read(self):
+        """Reads should span chunks and stop at the end of the content."""
+
+        stream = ContentStream(iter(['abc', '', 'defg', 'h']))
+        self.assertEquals('ab', stream.read(2))
+        self.assertEquals('cdef', stream.read(4))
+        self.assertEquals('gh', stream.read(10))
+        self.assertEquals('', stream.read(10))
+
+    def test_getvalue(self):
+        """getvalue() should return all of the content that hasn't been read."""
+
+        self.assertEquals('abcdefgh', ContentStream(['abc', 'defg', 'h']).getvalue())
+        stream = ContentStream(['abc', 'defg', 'h'])
+        stream.read(4)
+        self.assertEquals('efgh', stream.getvalue())
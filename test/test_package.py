@@ -5,7 +5,7 @@
 from test.strac_test import StoreTestCase
 
 from strac.repos import StoreRepository, StoreConnector
-from strac.packagenode import PackageNode
+from strac.packagenode import PackageNode, PackageManifest
 from strac.classnode import ClassNode
 from strac.classextensionnode import ClassExtensionNode
 from strac.namespacenode import NamespaceNode
@@ -62,3 +62,13 @@ class TestPackage(StoreTestCase):
 
         subnode = self.node.subnode_named('Baaaaarf')
         self.assertEquals(None, subnode)
+
+    def test_manifest(self):
+        """A Package's manifest should know the kind of each entry, and be cached."""
+
+        node = PackageNode.with_name(self.repos, 'TestPackage1', '1.0')
+        manifest = node.get_manifest()
+        self.assertEquals(PackageManifest.NAMESPACE, manifest.kind_of('Root.Smalltalk.StracTest'))
+        self.assertEquals(PackageManifest.EXTENSION, manifest.kind_of('Root.Smalltalk.Core.Object'))
+        self.assertEquals(None, manifest.kind_of('Root.Smalltalk.Baaaaarf'))
+        self.assertTrue(manifest is node.get_manifest())
@@ -0,0 +1,123 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from strac.pool import ConnectionPool
+
+import threading
+import unittest
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, string):
+        if self.connection.broken:
+            raise Exception('server closed the connection unexpectedly')
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    """Just enough of a DB-API connection to exercise the pool."""
+
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+        self.pool = ConnectionPool(self.connect, 2, 300, True)
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def test_reuse(self):
+        """A connection that has been checked in should be handed out again."""
+
+        first = self.pool.checkout()
+        self.pool.checkin(first)
+        second = self.pool.checkout()
+        self.assertTrue(first is second)
+        self.assertEquals(1, len(self.opened))
+
+    def test_nested_checkout(self):
+        """A thread that checks out twice should get the same connection both times."""
+
+        outer = self.pool.checkout()
+        inner = self.pool.checkout()
+        self.assertTrue(outer is inner)
+        self.pool.checkin(inner)
+        self.pool.checkin(outer)
+        self.assertEquals(1, len(self.opened))
+
+    def test_per_thread(self):
+        """Different threads should never share a connection."""
+
+        mine = self.pool.checkout()
+        theirs = []
+        def borrow():
+            pooled = self.pool.checkout()
+            theirs.append(pooled)
+            self.pool.checkin(pooled)
+        thread = threading.Thread(target = borrow)
+        thread.start()
+        thread.join()
+        self.assertFalse(mine is theirs[0])
+
+    def test_idle_timeout(self):
+        """Connections idle for too long should be closed instead of reused."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+        pooled.last_used -= 301
+        self.assertFalse(pooled is self.pool.checkout())
+        self.assertTrue(self.opened[0].closed)
+
+    def test_health_check(self):
+        """Connections that fail their health check should be replaced."""
+
+        pooled = self.pool.checkout()
+        self.pool.checkin(pooled)
+        self.opened[0].broken = True
+        self.assertFalse(pooled is self.pool.checkout())
+        self.assertEquals(2, len(self.opened))
+
+    def test_checkout_without_waiting(self):
+        """A thread that won't wait should get None when every connection is in use."""
+
+        mine = self.pool.checkout()
+        results = []
+        def borrow():
+            pooled = self.pool.checkout(False)
+            results.append(pooled)
+            results.append(self.pool.checkout(False))
+        thread = threading.Thread(target = borrow)
+        thread.start()
+        thread.join()
+        self.assertFalse(results[0] == None)
+        self.assertTrue(results[0] is results[1])
+
+        self.pool.size = 1
+        thread = threading.Thread(target = lambda: results.append(self.pool.checkout(False)))
+        thread.start()
+        thread.join()
+        self.assertEquals(None, results[2])
+        self.pool.checkin(mine)
@@ -0,0 +1,77 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from strac.cache import StoreCaches
+from strac.packagenode import PackageNode
+from strac.prefetch import Prefetcher
+from strac.workers import DeferredJob
+
+import logging
+import unittest
+
+class FakeRepository:
+    """Answers the queries needed to render one package with two classes, and counts them."""
+
+    def __init__(self, caches):
+        self.caches = caches
+        self.stream_threshold = 1000
+        self.prefetcher = None
+        self.queries = []
+        self.closed = False
+
+    def query(self, name, params = (), server_side = False):
+        self.queries.append(name)
+        if name == 'package_manifest':
+            return [('C', 'Root.Smalltalk.Foo'), ('C', 'Root.Smalltalk.Bar')]
+        if name == 'class_definition':
+            return [(len(params[1]), 0, 10)]
+        if name == 'methods_of_class':
+            return [(params[1], 'printOn:', 'printing', 11)]
+        return []
+
+    def start_queries(self, queries):
+        jobs = {}
+        for name, params in queries:
+            jobs[name] = DeferredJob(lambda name, params: list(self.query(name, params)), (name, params))
+        return jobs
+
+    def get_blobs(self, ids):
+        return {10: 'Object subclass: #Something', 11: 'printOn: aStream\n\t^self'}
+
+    def close(self):
+        self.closed = True
+
+class TestPrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.caches = StoreCaches()
+        self.repositories = []
+        self.prefetcher = Prefetcher(self._repository, logging.getLogger('strac-test'), 1)
+
+    def _repository(self):
+        repos = FakeRepository(self.caches)
+        self.repositories.append(repos)
+        return repos
+
+    def test_prefetch(self):
+        """Listing a package should render its classes into the content cache, once."""
+
+        listing = self._repository()
+        listing.prefetcher = self.prefetcher
+        package = PackageNode('/TestPackage1', '1.0', listing, 7)
+        self.assertEquals(2, len(list(package.get_entries())))
+
+        self.assertEquals(None, self.prefetcher.submit(package))
+        self.prefetcher.pool.submit(lambda: None).result()
+        self.assertEquals(2, len(self.repositories))
+        self.assert_(self.repositories[1].closed)
+        self.assertNotEquals(None, self.caches.get_rendered((7, 'Foo')))
+        self.assertNotEquals(None, self.caches.get_rendered((7, 'Bar')))
+
+    def test_byte_limit(self):
+        """Prefetching should stop once enough content has been rendered."""
+
+        self.prefetcher.max_bytes = 1
+        package = PackageNode('/TestPackage1', '1.0', self._repository(), 7)
+        self.assertEquals(1, self.prefetcher.submit(package).result())
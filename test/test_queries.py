@@ -0,0 +1,186 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from trac.versioncontrol.api import Changeset
+
+from strac.bundlenode import BundleNode
+from strac.cache import StoreCaches
+from strac.diff import PackageDiff
+from strac.packagenode import PackageManifest, PackageNode
+from strac.pool import ConnectionPool
+from strac.repos import StoreRepository
+from strac.searchindex import SearchIndex
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+class RecordingCursor:
+    """Binds parameters as pgdb does, and remembers each statement it executes.
+
+    A DECLARE or EXECUTE statement answers the rows its connection was told to give.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, string, params = None):
+        if params != None:
+            string = string % tuple([repr(param) for param in params])
+        self.connection.executed.append(string)
+        if string.startswith('DECLARE') or string.startswith('EXECUTE'):
+            self.rows, self.connection.answer = self.connection.answer, []
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        return self.fetchall()
+
+    def close(self):
+        pass
+
+class RecordingConnection:
+    """Just enough of a DB-API connection to run queries that return nothing."""
+
+    def __init__(self):
+        self.executed = []
+        self.answer = []
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class RecordingRepository(StoreRepository):
+    """Runs the real queries of a StoreRepository against a RecordingConnection.
+
+    answers maps the name of a query to the rows it should produce; other queries produce none.
+    """
+
+    def __init__(self, answers = {}):
+        self.pool = ConnectionPool(RecordingConnection, 1)
+        self.connection = self.pool.checkout()
+        self.caches = StoreCaches()
+        self.batch_size = 100
+        self.server_side_decoding = True
+        self.stream_threshold = 1000
+        self.query_pool = None
+        self.log = logging.getLogger('strac-test')
+        self.answers = answers
+
+    def query(self, name, params = (), server_side = False):
+        self.connection.connection.answer = list(self.answers.get(name, []))
+        return StoreRepository.query(self, name, params, server_side)
+
+    def executed(self):
+        return self.connection.connection.executed
+
+class TestServerSideQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.repos = RecordingRepository({
+            'latest_packages': [(2, 'TestPackage', '1.1', 200)],
+            'package_versions': [(1, '1.0', 100), (2, '1.1', 200)],
+            'entry_history': [(1, 'Root.Smalltalk.TestClass accessing value', 10),
+                              (2, 'Root.Smalltalk.TestClass accessing value', 11),
+                              (2, 'definition', 12)],
+            'package_manifest': [(PackageManifest.CLASS, 'Root.Smalltalk.TestClass')],
+            'package_parts_except': [('Root.Smalltalk.TestClass', 'definition', 12)],
+            'bundle_tree': [(10, 'B', 11, 'SubBundle', '1.0'), (10, 'B', 12, 'OtherBundle', '1.0'),
+                            (11, 'B', 13, 'InnerBundle', '1.0'), (11, 'P', 1, 'TestPackage', '1.0'),
+                            (12, 'P', 3, 'OtherPackage', '1.0'), (13, 'P', 4, 'InnerPackage', '1.0')],
+            'package_parts': [('Root.Smalltalk.TestClass', 'definition', 12)],
+            'decoded_blobs': [(12, 'Object subclass: #TestClass')],
+            'class_definition': [(5, 0, 12)],
+            'methods_of_class': [('Root.Smalltalk.TestClass', 'value', 'accessing', 99)],
+            })
+
+    def declared(self, table = ''):
+        return [string for string in self.repos.executed()
+                if string.startswith('DECLARE') and table in string]
+
+    def test_repeated_placeholder(self):
+        """A parameter used more than once in a query should be bound everywhere it appears."""
+
+        self.assertEquals([], list(self.repos.query('publications_since', (42,), server_side = True)))
+        declared = self.declared()
+        self.assertEquals(1, len(declared))
+        self.assertFalse('$1' in declared[0])
+        self.assertEquals(2, declared[0].count('>= 42'))
+
+    def test_path_history(self):
+        """The history of a class should be read with its parameters bound wherever they are used."""
+
+        history = list(self.repos.get_path_history('/TestPackage/TestClass'))
+        self.assertEquals([('/TestPackage/TestClass', 'TestPackage@1.1', Changeset.EDIT),
+                           ('/TestPackage/TestClass', 'TestPackage@1.0', Changeset.ADD)], history)
+        declared = self.declared('tw_dataandsourcesview')
+        self.assertEquals(1, len(declared))
+        self.assertFalse('$' in declared[0])
+        self.assertEquals(6, declared[0].count("p.name = 'TestPackage'"))
+        self.assertEquals(4, declared[0].count("environmentstring = 'Root.Smalltalk'"))
+
+    def test_entry_origins(self):
+        """Blame should find the version that introduced each part from the same entry history."""
+
+        origins = self.repos.get_entry_origins('TestPackage', 'TestClass', '1.1')
+        self.assertEquals({None: '1.0', 11: '1.1', 12: '1.1'}, origins)
+        self.assertEquals(1, len(self.declared('tw_dataandsourcesview')))
+
+    def test_package_diff(self):
+        """The parts that differ between two package versions should be found with both ids bound."""
+
+        old = PackageNode('/TestPackage', '1.0', self.repos, 1)
+        new = PackageNode('/TestPackage', '1.1', self.repos, 2)
+        changes = PackageDiff(self.repos, old, new).get_changes()
+        self.assertEquals([Changeset.EDIT], [change[3] for change in changes])
+        declared = self.declared('EXCEPT')
+        self.assertEquals(2, len(declared))
+        self.assertEquals(6, declared[0].count('packageref = 1'))
+        self.assertEquals(6, declared[0].count('packageref = 2'))
+        self.assertEquals(6, declared[1].count('packageref = 1'))
+
+    def test_packages_within_subbundle(self):
+        """A bundle within another should only answer its own packages, from the shared tree."""
+
+        BundleNode('/TestBundle', '1.0', self.repos, 10).get_tree()
+        subbundle = BundleNode('/SubBundle', '1.0', self.repos, 11)
+        packages = self.repos._packages_within(subbundle)
+        self.assertEquals(['InnerPackage', 'TestPackage'], sorted(packages.keys()))
+        self.assertEquals(4, packages['InnerPackage'].id)
+
+    def test_search_index(self):
+        """Indexing a package should read its parts with its primary key bound wherever it is used."""
+
+        directory = tempfile.mkdtemp()
+        try:
+            index = SearchIndex(os.path.join(directory, 'search.db'))
+            self.assertEquals(1, index.update(self.repos, True))
+            self.assertEquals([('TestPackage', '1.1', 'Root.Smalltalk.TestClass', 200)],
+                              index.search(['subclass:']))
+        finally:
+            shutil.rmtree(directory)
+        declared = self.declared('tw_dataandsourcesview WHERE')
+        self.assertEquals(1, len(declared))
+        self.assertEquals(6, declared[0].count('packageref = 2'))
+
+    def test_method_without_source(self):
+        """A method whose source is missing from tw_blob should still be listed."""
+
+        package = PackageNode('/TestPackage', '1.1', self.repos, 2)
+        content = package.subnode_named('TestClass').get_content().read()
+        self.assertTrue('accessing' in content)
+        prepared = [string for string in self.repos.executed()
+                    if string.startswith('PREPARE strac_methods_of_class')]
+        self.assertEquals(1, len(prepared))
+        self.assertFalse('tw_blob' in prepared[0])
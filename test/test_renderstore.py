@@ -0,0 +1,40 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from strac.renderstore import RenderStore
+
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestRenderStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = RenderStore(os.path.join(self.directory, 'cache', 'render.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """Content stored in the render store should be returned unchanged."""
+
+        self.store.put((12, 'StracTest.StracClass11'), ('C', '{{{\nfoo\n}}}\n'))
+        self.assertEquals(('C', '{{{\nfoo\n}}}\n'), self.store.get((12, 'StracTest.StracClass11')))
+        self.assertEquals(None, self.store.get((13, 'StracTest.StracClass11')))
+
+    def test_shared(self):
+        """A second store opened on the same file should see the first store's content."""
+
+        self.store.put((12, 'StracTest'), ('N', 'namespace'))
+        other = RenderStore(self.store.path)
+        self.assertEquals(('N', 'namespace'), other.get((12, 'StracTest')))
+
+    def test_unusable_file(self):
+        """A render store that can't be opened should neither store nor fail."""
+
+        store = RenderStore(self.directory)
+        store.put((12, 'StracTest'), ('N', 'namespace'))
+        self.assertEquals(None, store.get((12, 'StracTest')))
@@ -6,12 +6,36 @@ from test.strac_test import StoreTestCase
 
 from strac.repos import StoreRepository, StoreConnector, StoreChangeset
 from strac.bundlenode import BundleNode
+from strac.revcache import RevisionCache, SYNCED_KEY
 from strac.classnode import ClassNode
+from strac.workers import WorkerPool
+from trac.versioncontrol.api import NoSuchChangeset
 
+from trac.util.datefmt import utc
+
+from datetime import datetime
 from time import time
 
 class TestRepository(StoreTestCase):
 
+    def setUp(self):
+        StoreTestCase.setUp(self)
+        self._clear_revision_cache()
+
+    def tearDown(self):
+        self._clear_revision_cache()
+        StoreTestCase.tearDown(self)
+
+    def _clear_revision_cache(self):
+        """Empty the revision cache in the test environment, which outlives each test."""
+
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.execute('DELETE FROM node_change')
+        cursor.execute('DELETE FROM revision')
+        cursor.execute('DELETE FROM system WHERE name = %s', (SYNCED_KEY,))
+        db.commit()
+
     def test_connector(self):
         """Make sure that the Store connector properly loads the database modules."""
 
@@ -48,6 +72,10 @@ class TestRepository(StoreTestCase):
             '/TestPackage2',
             self.repos.normalize_path('/TestBundle/TestPackage2'))
 
+        self.assertEquals(
+            '/TestBundle',
+            self.repos.normalize_path('/OtherBundle/TestBundle'))
+
         self.assertEquals(
             '/TestPackage2/StracTest.StracClass11',
             self.repos.normalize_path('/TestBundle/TestPackage2/StracTest.StracClass11'))
@@ -67,6 +95,18 @@ class TestRepository(StoreTestCase):
         node2 = self.repos.get_node('/TestPackage2/StracTest.StracClass21')
         self.assertEquals(ClassNode, node2.__class__)
 
+    def test_get_node_newly_published(self):
+        """Names published since the catalog was last refreshed should be found."""
+
+        latest = self.repos.caches.latest_packages
+        latest.refresh(self.repos)
+        # Make the catalog look as if TestPackage2 had been published after its last refresh.
+        del latest._latest['TestPackage2']
+        latest._newest_key = 0
+        latest._checked = time()
+
+        self.assertEquals('TestPackage2', self.repos.get_node('/TestPackage2', '1.0').name)
+
     def test_revision_stubs(self):
         """Assert that the calls relating for revisions are properly stubbed, that is,
         they don't toss exceptions in normal usage.
@@ -85,6 +125,94 @@ class TestRepository(StoreTestCase):
         [(p, r, h) for (p, r, h) in self.repos.get_path_history('/', None, None)]
 
         # Called during 'get changes' session
-        # [(o, n, k, c) for (o, n, k, c) in self.repos.get_changes('/TestPackage1', '1.0', '/TestPackage1', '1.1')]
+        [(o, n, k, c) for (o, n, k, c) in self.repos.get_changes('/TestPackage1', '1.0', '/TestPackage1', '1.0')]
 
         self.assertTrue(True, 'get_changesets() returned an iterable')
+
+    def test_changesets(self):
+        """Publications should appear as changesets, newest first, however they are paged."""
+
+        start, stop = datetime(1990, 1, 1, tzinfo = utc), datetime.now(utc)
+        revs = [c.rev for c in self.repos.get_changesets(start, stop)]
+        self.assertTrue('TestBundle@1.0' in revs)
+        self.assertTrue('OtherBundle@1.0' in revs)
+
+        self.repos.batch_size = 1
+        self.assertEquals(revs, [c.rev for c in self.repos.get_changesets(start, stop)])
+
+    def test_get_changeset(self):
+        """A single publication should be found by its rev, with its comment."""
+
+        changeset = self.repos.get_changeset('TestBundle@1.0')
+        self.assertEquals('Comment for version 1.0', changeset.message)
+        self.assertEquals([('/TestBundle', BundleNode.DIRECTORY, StoreChangeset.ADD, None, -1)],
+                          list(changeset.get_changes()))
+        self.assertEquals('TestBundle', self.repos.get_node('/TestBundle', changeset.rev).name)
+
+    def test_get_changeset_of_node(self):
+        """Nodes' plain version revs should have stand-in changesets, as Trac asks for them."""
+
+        node = self.repos.get_node('/TestPackage1/StracTest.StracClass11', '1.0')
+        changeset = self.repos.get_changeset(node.rev)
+        self.assertEquals('1.0', changeset.rev)
+        self.assertEquals([], list(changeset.get_changes()))
+        self.assertEquals('ONLY', self.repos.get_changeset(self.repos.get_node('/').rev).rev)
+        self.assertRaises(NoSuchChangeset, self.repos.get_changeset, 'TestPackage1@9.9')
+
+    def test_revision_cache(self):
+        """Changesets read from the revision cache should match those read from Store."""
+
+        start, stop = datetime(1990, 1, 1, tzinfo = utc), datetime.now(utc)
+        expected = [(c.rev, c.message) for c in self.repos.get_changesets(start, stop)]
+
+        self.repos.revisions = RevisionCache(self.env)
+        # Only a forced sync copies the whole history.
+        self.assertEquals(0, self.repos.revisions.sync(self.repos))
+        self.assertFalse(self.repos.revisions.synced)
+        self.assertEquals(expected, [(c.rev, c.message) for c in self.repos.get_changesets(start, stop)])
+
+        self.assertEquals(len(expected), self.repos.revisions.sync(self.repos, True))
+        self.assertTrue(self.repos.revisions.synced)
+        self.assertEquals(0, self.repos.revisions.sync(self.repos, True))
+        self.assertEquals(sorted(expected),
+                          sorted([(c.rev, c.message) for c in self.repos.get_changesets(start, stop)]))
+        self.assertEquals('Comment for version 1.0', self.repos.get_changeset('TestBundle@1.0').message)
+
+    def test_previous_and_next_rev(self):
+        """Versions should step to their neighbours within their own bundle or package."""
+
+        self.assertEquals(None, self.repos.previous_rev('1.0', '/TestPackage1'))
+        self.assertEquals(None, self.repos.next_rev('1.0', '/TestPackage1/StracTest.StracClass11'))
+        self.assertEquals(None, self.repos.previous_rev('TestBundle@1.0'))
+        self.assertEquals(None, self.repos.previous_rev('1.0'))
+        self.assertFalse(self.repos.rev_older_than('TestBundle@1.0', 'TestBundle@1.0'))
+
+    def test_get_changes(self):
+        """Package versions should be compared entry by entry, and only on what differs."""
+
+        self.assertEquals([], list(self.repos.get_changes('/TestPackage1', '1.0', '/TestPackage1', '1.0')))
+
+        changes = self.repos.get_changes('/TestPackage1', '1.0', '/TestPackage2', '1.0')
+        removed = [old.path for old, new, kind, change in changes if change == StoreChangeset.DELETE]
+        added = [new.path for old, new, kind, change in changes if change == StoreChangeset.ADD]
+        self.assertTrue('/TestPackage1/StracTest.StracClass11' in removed)
+        self.assertTrue('/TestPackage2/StracTest.StracClass21' in added)
+        for old, new, kind, change in changes:
+            self.assertEquals(ClassNode.FILE, kind)
+
+        changes = self.repos.get_changes('/TestPackage1/StracTest.StracClass11', '1.0',
+                                         '/TestPackage1/StracTest.StracClass11', '1.0')
+        self.assertEquals([], list(changes))
+
+    def test_start_queries(self):
+        """Queries started together should produce the same rows with or without a query pool."""
+
+        queries = [('package_by_name', ('TestPackage1', '1.0')), ('latest_packages', ())]
+        expected = [list(self.repos.query(name, params)) for name, params in queries]
+
+        jobs = self.repos.start_queries(queries)
+        self.assertEquals(expected, [jobs[name].result() for name, params in queries])
+
+        self.repos.query_pool = WorkerPool(2, 'strac-test')
+        jobs = self.repos.start_queries(queries)
+        self.assertEquals(expected, [jobs[name].result() for name, params in queries])
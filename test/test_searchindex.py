@@ -0,0 +1,126 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from strac.searchindex import SearchIndex, _sent_selectors
+
+import os
+import shutil
+import tempfile
+import unittest
+
+class FakeRepository:
+    """Answers the queries used by SearchIndex from lists of packages, parts and blobs."""
+
+    def __init__(self, packages, parts, blobs):
+        self.packages = packages
+        self.parts = parts
+        self.blobs = blobs
+        self.fetched = []
+
+    def query(self, name, params = (), server_side = False):
+        if name == 'latest_packages':
+            return list(self.packages)
+        if name == 'packages_since':
+            return [row for row in self.packages if row[0] > params[0]]
+        return self.parts[params[0]]
+
+    def fetch_blobs(self, ids):
+        self.fetched.extend(ids)
+        return dict([(id, self.blobs[id]) for id in ids])
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = SearchIndex(os.path.join(self.directory, 'search.db'))
+        self.repos = FakeRepository(
+            [(1, 'TestPackage1', '1.0', 100)],
+            {1: [('Root.Smalltalk.Foo', 'Root.Smalltalk.Foo>>printOn: {printing}', 10),
+                 ('Root.Smalltalk.Foo', 'definition', 11),
+                 ('Root.Smalltalk.Bar', 'Root.Smalltalk.Bar>>printOn: {printing}', 10)],
+             2: [('Root.Smalltalk.Foo', 'definition', 12)]},
+            {10: 'printOn: aStream\n\taStream nextPutAll: self name',
+             11: 'Object subclass: #Foo',
+             12: 'Object subclass: #Foo instanceVariableNames: widget'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_search(self):
+        """Documents should be found by every word they contain, in any case."""
+
+        self.assertFalse(self.index.is_built())
+        self.assertEquals(1, self.index.update(self.repos, True))
+        self.assertTrue(self.index.is_built())
+        self.assertEquals([10, 11], sorted(self.repos.fetched))
+
+        self.assertEquals([('TestPackage1', '1.0', 'Root.Smalltalk.Bar', 100),
+                           ('TestPackage1', '1.0', 'Root.Smalltalk.Foo', 100)],
+                          self.index.search(['printOn:', 'NEXTPUTALL']))
+        self.assertEquals(['Root.Smalltalk.Foo'],
+                          [row[2] for row in self.index.search(['subclass', 'printOn:'])])
+        self.assertEquals([], self.index.search(['widget']))
+        self.assertEquals([], self.index.search([':']))
+
+    def test_update(self):
+        """A new version of a package should replace the one indexed before."""
+
+        self.index.update(self.repos, True)
+        self.repos.packages.append((2, 'TestPackage1', '1.1', 110))
+        self.assertEquals(1, self.index.update(self.repos, True))
+        self.assertEquals([('TestPackage1', '1.1', 'Root.Smalltalk.Foo', 110)],
+                          self.index.search(['widget']))
+        self.assertEquals([], self.index.search(['nextPutAll']))
+        self.assertEquals(0, self.index.update(self.repos, True))
+
+    def test_cross_reference(self):
+        """Selectors should map to the methods that implement and send them."""
+
+        self.repos.parts[1].append(('Root.Smalltalk.Foo', 'Root.Smalltalk.Foo class>>new {instance creation}', 13))
+        self.repos.blobs[13] = 'new\n\t^super new initialize; yourself'
+        self.index.update(self.repos, True)
+
+        self.assertEquals([('TestPackage1', '1.0', 'Root.Smalltalk.Bar', 0),
+                           ('TestPackage1', '1.0', 'Root.Smalltalk.Foo', 0)],
+                          self.index.implementors('printOn:'))
+        self.assertEquals([('TestPackage1', '1.0', 'Root.Smalltalk.Foo', 1)],
+                          self.index.implementors('new'))
+        self.assertEquals([('TestPackage1', '1.0', 'Root.Smalltalk.Bar', 0, 'printOn:'),
+                           ('TestPackage1', '1.0', 'Root.Smalltalk.Foo', 0, 'printOn:')],
+                          self.index.senders('nextPutAll:'))
+        self.assertEquals([('TestPackage1', '1.0', 'Root.Smalltalk.Foo', 1, 'new')],
+                          self.index.senders('initialize'))
+        self.assertEquals([], self.index.senders('aStream'))
+
+        self.repos.packages.append((2, 'TestPackage1', '1.1', 110))
+        self.index.update(self.repos, True)
+        self.assertEquals([], self.index.implementors('printOn:'))
+        self.assertEquals([], self.index.senders('nextPutAll:'))
+
+class TestSentSelectors(unittest.TestCase):
+
+    def test_sends(self):
+        """Unary, keyword and cascaded sends, and literal symbols, should be found."""
+
+        source = ('at: index put: value\n'
+                  '\t"Comments: are skipped" | old |\n'
+                  '\told := self basicAt: index. self changed; perform: #update: with: \'text: here\'.\n'
+                  '\t^(items collect: [:each | each key]) at: 1 put: value size')
+        self.assertEquals(['at:put:', 'basicAt:', 'changed', 'collect:', 'key',
+                           'perform:with:', 'size', 'update:'],
+                          sorted(_sent_selectors(source)))
+        self.assertEquals(set(), _sent_selectors('yourself'))
+
+    def test_declarations(self):
+        """Temporaries, block arguments, pragmas and assignments should not count as sends."""
+
+        source = ('foo\n'
+                  '\t| stream result |\n'
+                  '\t<primitive: 60>\n'
+                  '\tstream := WriteStream on: String new.\n'
+                  '\tresult _ stream contents.\n'
+                  '\titems do: [:a :b | | c d | c := a size]; do: [:e || f g | f := e]\n'
+                  '\t^(result | stream) or: [result]')
+        self.assertEquals(['contents', 'do:', 'new', 'on:', 'or:', 'size'],
+                          sorted(_sent_selectors(source)))
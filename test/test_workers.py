@@ -0,0 +1,83 @@
+# Copyright (C) 2009 Ashley J. Wilson
+# This software is licensed as described in the file COPYING in the root
+# directory of this distribution.
+
+from test.test_pool import FakeConnection
+from strac.pool import ConnectionPool
+from strac.repos import StoreRepository
+from strac.workers import Job, WorkerPool
+
+import logging
+import threading
+import unittest
+
+class FakeRepository(StoreRepository):
+    """Answers every query with the connection it ran on, without a database."""
+
+    def __init__(self, pool, query_pool, query_connections):
+        self.pool = pool
+        self.connection = pool.checkout()
+        self.query_pool = query_pool
+        self.query_connections = query_connections
+        self.log = logging.getLogger('strac-test')
+
+    def query(self, name, params = (), server_side = False):
+        return [(self.connection,)]
+
+class RollbackCountingConnection(FakeConnection):
+
+    def __init__(self):
+        FakeConnection.__init__(self)
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(1, 'strac-test')
+
+    def test_claim(self):
+        """A job should only ever be claimed once."""
+
+        job = Job(lambda: None, ())
+        self.assertTrue(job.claim())
+        self.assertFalse(job.claim())
+
+    def test_run_in_place(self):
+        """A job that no worker has started should be left to the thread that claims it."""
+
+        release = threading.Event()
+        self.pool.submit(release.wait)
+        calls = []
+        job = self.pool.submit(calls.append, 'worker')
+
+        self.assertTrue(job.claim())
+        release.set()
+        self.pool.submit(lambda: None).result()
+        self.assertEquals([], calls)
+
+    def test_held_connections(self):
+        """Query workers should keep a connection of their own from one query to the next, and
+        end its transaction after each."""
+
+        opened = []
+        def connect():
+            opened.append(RollbackCountingConnection())
+            return opened[-1]
+        connections = ConnectionPool(connect, 1)
+        query_connections = ConnectionPool(connect, 1)
+        repos = FakeRepository(connections, self.pool, query_connections)
+
+        first = self.pool.submit(repos._rows_elsewhere, 'latest_packages', ()).result()
+        second = self.pool.submit(repos._rows_elsewhere, 'latest_packages', ()).result()
+        self.assertTrue(first[0][0] is second[0][0])
+        self.assertFalse(first[0][0] is repos.connection)
+        self.assertEquals(2, len(opened))
+        self.assertEquals(2, first[0][0].connection.rollbacks)
+        self.assertEquals([], query_connections._idle)
+
+        jobs = repos.start_queries([('latest_packages', ()), ('latest_bundles', ())])
+        self.assertEquals([(repos.connection,)], jobs['latest_packages'].result())
+        self.assertEquals(1, len(jobs['latest_bundles'].result()))